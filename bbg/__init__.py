@@ -1,3 +1,3 @@
-from bbg.terminal import LocalTerminal, Terminal
+from bbg.terminal import LocalTerminal, MultiTerminal, Terminal
 
-__all__ = ['LocalTerminal', 'Terminal']
+__all__ = ['LocalTerminal', 'MultiTerminal', 'Terminal']
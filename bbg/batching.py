@@ -0,0 +1,115 @@
+import threading
+
+from bbg.reference_data import ReferenceDataRequest
+from bbg.terminal import LocalTerminal
+
+
+class ReferenceDataBatch(object):
+    """Reference data requests waiting to be merged into a single wire request"""
+
+    def __init__(self, fields, overrides):
+        self.fields = fields
+        self.overrides = overrides
+        self.requests = []
+        self.n_sids = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.merged = None
+        self.error = None
+
+    def add(self, request):
+        self.requests.append(request)
+        self.n_sids += len(request.sids)
+
+    @property
+    def sids(self):
+        seen = set()
+        return [sid for req in self.requests for sid in req.sids if not (sid in seen or seen.add(sid))]
+
+
+class ReferenceDataBatcher(object):
+    """Front end to Terminal.get_reference_data for services issuing many small concurrent requests.
+
+    The first caller for a given set of fields and overrides waits up to window seconds (or until max_sids
+    securities are queued) for other threads asking for the same fields and overrides, then sends a single
+    ReferenceDataRequest for all their securities. Each caller gets its own ReferenceDataResponse holding its
+    securities only, together with its own security_errors / field_errors, and raises according to its own
+    ignore_security_error / ignore_field_error.
+
+    Parameters
+    ----------
+    terminal: Terminal used to execute the merged requests. If None, LocalTerminal is used
+    window: seconds to wait for other callers before sending a request
+    max_sids: (optional) send the request as soon as this many securities are queued
+    """
+
+    def __init__(self, terminal=None, window=.005, max_sids=None):
+        self.terminal = terminal or LocalTerminal
+        self.window = window
+        self.max_sids = max_sids
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __repr__(self):
+        fmtargs = dict(clz=self.__class__.__name__, terminal=self.terminal, window=self.window)
+        return '<{clz}({terminal}, window={window})'.format(**fmtargs)
+
+    def get_reference_data(self, sids, flds, ignore_security_error=0, ignore_field_error=0, **overrides):
+        req = ReferenceDataRequest(sids, flds, ignore_security_error=ignore_security_error,
+                                   ignore_field_error=ignore_field_error, **overrides)
+        fields = sorted(set(req.fields))
+        try:
+            key = (tuple(fields), tuple(sorted(overrides.items())))
+            hash(key)
+        except TypeError:
+            # unhashable override values cannot be matched with other calls
+            return self.terminal.execute(req)
+
+        with self._lock:
+            batch = self._pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = self._pending[key] = ReferenceDataBatch(fields, overrides)
+            batch.add(req)
+            if self.max_sids and batch.n_sids >= self.max_sids:
+                del self._pending[key]
+                batch.full.set()
+
+        if is_leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+            self._execute(batch)
+        else:
+            batch.done.wait()
+        return self._split(batch, req)
+
+    def _execute(self, batch):
+        try:
+            merged = ReferenceDataRequest(batch.sids, batch.fields, ignore_security_error=1, ignore_field_error=1,
+                                          **batch.overrides)
+            self.terminal.execute(merged)
+            batch.merged = merged
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    @staticmethod
+    def _split(batch, req):
+        """Fill the response and errors of the specified caller request from the merged request"""
+        if batch.error is not None:
+            raise batch.error
+        merged = batch.merged
+        sids = set(req.sids)
+        req.new_response()
+        for sid in req.sids:
+            if sid in merged.response.response_map:
+                field_map = merged.response.response_map[sid]
+                req.response.on_security_data(sid, {f: field_map[f] for f in req.fields})
+        req.security_errors.extend(e for e in merged.security_errors if e.security in sids)
+        flds = set(req.fields)
+        req.field_errors.extend(e for e in merged.field_errors if e.security in sids and e.field in flds)
+        req.has_exception and req.raise_exception()
+        return req.response
@@ -0,0 +1,114 @@
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from bbg.utils import datetime_to_ns, ns_to_datetime
+
+# columns which are dictionary encoded, they hold a few distinct strings repeated on every tick
+CATEGORICAL_COLUMNS = ('type', 'conditionCodes', 'exchangeCode')
+
+
+class CompactRecords(object):
+    """Columnar store for tick or bar records (list of dicts, see IntradayTickRequest.parse_event).
+
+    Each appended batch is converted to numpy columns: the time as int64 nanoseconds (UTC), the categorical
+    columns as int32 codes into a dictionary shared by all the batches, the price and size columns optionally
+    narrowed to float32 and int32, and any other column as a plain numpy array.
+
+    Parameters
+    ----------
+    price_columns: columns stored as float32 if float32_prices
+    size_columns: columns stored as int32 if int32_sizes
+    """
+
+    def __init__(self, price_columns=(), size_columns=(), float32_prices=False, int32_sizes=False):
+        self.dtypes = {}
+        float32_prices and self.dtypes.update({c: np.float32 for c in price_columns})
+        int32_sizes and self.dtypes.update({c: np.int32 for c in size_columns})
+        self.columns = []
+        self.chunks = []
+        self.lengths = []
+        self.dictionaries = {c: OrderedDict() for c in CATEGORICAL_COLUMNS}
+        self.tz = None
+
+    def __len__(self):
+        return sum(self.lengths)
+
+    def _encode(self, col, values):
+        dictionary = self.dictionaries[col]
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            if v is None or v != v:  # missing or nan
+                codes[i] = -1
+            else:
+                codes[i] = dictionary.setdefault(v, len(dictionary))
+        return codes
+
+    def append(self, records):
+        if not records:
+            return
+        chunk = {}
+        for rec in records:
+            for col in rec:
+                if col not in chunk:
+                    chunk[col] = None
+                    col in self.columns or self.columns.append(col)
+        for col in chunk:
+            values = [rec.get(col) for rec in records]
+            if col == 'time':
+                chunk[col], tz = datetime_to_ns(values)
+                self.tz = self.tz or tz
+            elif col in self.dictionaries:
+                chunk[col] = self._encode(col, values)
+            elif col in self.dtypes:
+                chunk[col] = np.array(values, dtype=self.dtypes[col])
+            else:
+                chunk[col] = np.array(values)
+        self.chunks.append(chunk)
+        self.lengths.append(len(records))
+
+    def _column(self, col):
+        parts = []
+        for chunk, n in zip(self.chunks, self.lengths):
+            if col in chunk:
+                parts.append(chunk[col])
+            elif col == 'time':
+                parts.append(np.full(n, np.iinfo(np.int64).min, dtype=np.int64))  # NaT
+            elif col in self.dictionaries:
+                parts.append(np.full(n, -1, dtype=np.int32))
+            else:
+                parts.append(np.full(n, np.nan, dtype=object))
+        return np.concatenate(parts)
+
+    def as_frame(self):
+        data = OrderedDict()
+        for col in self.columns:
+            values = self._column(col)
+            if col == 'time':
+                values = ns_to_datetime(values, self.tz)
+            elif col in self.dictionaries:
+                values = pd.Categorical.from_codes(values, categories=list(self.dictionaries[col]))
+            data[col] = values
+        return pd.DataFrame(data, columns=self.columns)
+
+    def memory_usage(self):
+        """:return: Series of the bytes held by each column, including the dictionaries"""
+        usage = OrderedDict()
+        for col in self.columns:
+            nbytes = sum(chunk[col].nbytes for chunk in self.chunks if col in chunk)
+            if col in self.dictionaries:
+                nbytes += sum(sys.getsizeof(v) for v in self.dictionaries[col])
+            usage[col] = nbytes
+        return pd.Series(usage, dtype=np.int64)
+
+
+def records_memory_usage(records):
+    """:return: Series of the bytes held by each key of a list of dicts (estimate, values are not de-duplicated)"""
+    usage = OrderedDict()
+    for rec in records:
+        for col, v in rec.items():
+            usage[col] = usage.get(col, 0) + sys.getsizeof(v)
+    usage['<dicts>'] = sum(sys.getsizeof(rec) for rec in records)
+    return pd.Series(usage, dtype=np.int64)
@@ -0,0 +1,218 @@
+import os
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from bbg.historical_data import HistoricalDataRequest
+from bbg.intraday_bar import IntradayBarRequest
+from bbg.intraday_tick import IntradayTickRequest
+from bbg.logger import LOGGER
+from bbg.reference_data import ReferenceDataRequest
+
+REQUEST_TYPES = {
+    'historical': HistoricalDataRequest,
+    'reference': ReferenceDataRequest,
+    'intraday_tick': IntradayTickRequest,
+    'intraday_bar': IntradayBarRequest,
+}
+
+WorkerStats = namedtuple('WorkerStats', ['pid', 'requests', 'rows', 'nbytes', 'seconds'])
+
+
+class RequestSpec(namedtuple('RequestSpec', ['kind', 'args', 'kwargs'])):
+    """Picklable description of a request, e.g. RequestSpec('historical', (sids, fields), dict(start=start))"""
+
+    def create(self):
+        return REQUEST_TYPES[self.kind](*self.args, **self.kwargs)
+
+
+def historical_specs(sids, fields, chunk_size=50, **kwargs):
+    """Split a historical request into specs of at most chunk_size securities"""
+    sids = isinstance(sids, str) and [sids] or list(sids)
+    return [RequestSpec('historical', (sids[i:i + chunk_size], fields), kwargs)
+            for i in range(0, len(sids), chunk_size)]
+
+
+def intraday_tick_specs(sids, start, end, freq='1D', **kwargs):
+    """Split an intraday tick request into one spec per security and period of length freq"""
+    sids = isinstance(sids, str) and [sids] or list(sids)
+    bounds = list(pd.date_range(pd.to_datetime(start), pd.to_datetime(end), freq=freq))
+    bounds = [pd.to_datetime(start)] + [b for b in bounds[1:] if b < pd.to_datetime(end)] + [pd.to_datetime(end)]
+    return [RequestSpec('intraday_tick', (sid,), dict(kwargs, start=s, end=e))
+            for sid in sids for s, e in zip(bounds[:-1], bounds[1:])]
+
+
+def frame_to_shared(frame):
+    """Copy the numeric, datetime and categorical columns of a frame into one shared memory block.
+    :return: picklable descriptor of the frame, see frame_from_shared"""
+    arrays, columns, objects = [], [], {}
+    series = [('__index__', pd.Series(frame.index))] + list(frame.items())
+    for i, (name, col) in enumerate(series):
+        meta = {}
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            meta['categories'] = list(col.cat.categories)
+            values = col.cat.codes.to_numpy()
+        elif getattr(col.dtype, 'tz', None) is not None:
+            meta['tz'] = str(col.dtype.tz)
+            values = col.dt.tz_convert(None).to_numpy()
+        else:
+            values = col.to_numpy()
+        if values.dtype.kind not in 'biufmM':
+            objects[name] = values.tolist()
+            continue
+        values = np.ascontiguousarray(values)
+        columns.append((i, name, values.dtype.str, values.shape[0], meta))
+        arrays.append(values)
+    offsets = np.cumsum([0] + [a.nbytes for a in arrays])
+    shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]), 1))
+    try:
+        for a, offset in zip(arrays, offsets):
+            shm.buf[offset:offset + a.nbytes] = a.view(np.uint8).reshape(-1)
+        desc = dict(shm=shm.name, columns=[c + (int(o),) for c, o in zip(columns, offsets)], objects=objects,
+                    order=['__index__'] + list(frame.columns), index_name=frame.index.name, nbytes=int(offsets[-1]))
+    finally:
+        shm.close()
+    # the reading process owns the block from now on and unlinks it, do not let this process' tracker clean it up.
+    # The tracker knows posix blocks by their name with the leading slash that shm.name strips
+    resource_tracker.unregister(os.name == 'posix' and '/' + shm.name or shm.name, 'shared_memory')
+    return desc
+
+
+def frame_from_shared(desc):
+    """Rebuild the frame described by frame_to_shared and release the shared memory block"""
+    shm = shared_memory.SharedMemory(name=desc['shm'])
+    data = dict(desc['objects'])
+    try:
+        for _, name, dtype, n, meta, offset in desc['columns']:
+            values = np.frombuffer(shm.buf, dtype=dtype, count=n, offset=offset).copy()
+            if 'categories' in meta:
+                values = pd.Categorical.from_codes(values, categories=meta['categories'])
+            elif 'tz' in meta:
+                values = pd.DatetimeIndex(values).tz_localize('UTC').tz_convert(meta['tz'])
+            data[name] = values
+    finally:
+        shm.close()
+        shm.unlink()
+    index = pd.Index(data.pop('__index__'), name=desc['index_name'])
+    return pd.DataFrame({c: data[c] for c in desc['order'][1:]}, index=index, columns=desc['order'][1:])
+
+
+def release_shared(name):
+    """Unlink a shared memory block written by frame_to_shared which will not be read"""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+_terminal = None
+
+
+def _init_worker(host, port, terminal_options):
+    global _terminal
+    from bbg.terminal import Terminal
+    _terminal = Terminal(host, port, **terminal_options)
+
+
+def _run_spec(spec):
+    """Executed in the worker processes, each of which owns its own Terminal"""
+    t0 = time.time()
+    req = spec.create()
+    response = _terminal.execute(req)
+    if spec.kind == 'historical':
+        frames = list(response.as_map().items())
+    elif spec.kind == 'reference':
+        frames = [(None, response.as_frame())]
+    else:
+        frames = [(req.sid, response.as_frame())]
+    results = [(key, frame_to_shared(frame), len(frame)) for key, frame in frames]
+    return os.getpid(), results, time.time() - t0
+
+
+class BulkFetchCoordinator(object):
+    """Runs a bulk job, split in RequestSpecs, across a pool of processes each owning a Terminal session, so that
+    parsing is not bound by a single interpreter. Frames are handed back through shared memory rather than
+    pickled.
+
+    Parameters
+    ----------
+    host, port: server each worker connects to
+    n_workers: number of worker processes
+    progress: (optional) callable(done, total, spec) called as each spec completes
+    terminal_options: passed to the Terminal of each worker, e.g. pipelined=True
+    """
+
+    def __init__(self, host='localhost', port=8194, n_workers=4, progress=None, **terminal_options):
+        self.host = host
+        self.port = port
+        self.n_workers = n_workers
+        self.progress = progress
+        self.terminal_options = terminal_options
+        self.errors = []
+        self._stats = defaultdict(lambda: [0, 0, 0, 0.])
+
+    def __repr__(self):
+        fmtargs = dict(clz=self.__class__.__name__, host=self.host, port=self.port, n=self.n_workers)
+        return '<{clz}({host}:{port}, n_workers={n})'.format(**fmtargs)
+
+    def iter_results(self, specs):
+        """Yield (spec, key, frame) as the requests complete. key is the security for historical and intraday
+        specs and None for reference data. Failed specs are logged and recorded in errors."""
+        specs = list(specs)
+        self.errors = []
+        init_args = (self.host, self.port, self.terminal_options)
+        # blocks written by the workers but not read yet, unlinked if the iteration is stopped early or fails
+        outstanding = set()
+        with ProcessPoolExecutor(self.n_workers, initializer=_init_worker, initargs=init_args) as pool:
+            futures = {pool.submit(_run_spec, spec): spec for spec in specs}
+            unread = set(futures)
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    unread.discard(future)
+                    spec = futures[future]
+                    try:
+                        pid, results, seconds = future.result()
+                    except Exception as e:
+                        LOGGER.error('request %r failed: %s' % (spec, e))
+                        self.errors.append((spec, e))
+                    else:
+                        outstanding.update(desc['shm'] for _, desc, _ in results)
+                        stats = self._stats[pid]
+                        stats[0] += 1
+                        stats[3] += seconds
+                        for key, desc, n in results:
+                            stats[1] += n
+                            stats[2] += desc['nbytes']
+                            outstanding.discard(desc['shm'])
+                            yield spec, key, frame_from_shared(desc)
+                    self.progress and self.progress(done, len(specs), spec)
+            finally:
+                for future in unread:
+                    if not future.cancel():
+                        try:
+                            outstanding.update(desc['shm'] for _, desc, _ in future.result()[1])
+                        except Exception:
+                            pass
+                for name in outstanding:
+                    release_shared(name)
+
+    def run(self, specs):
+        """:return: map of key to frame. Frames of a key split across several specs are concatenated"""
+        frames = defaultdict(list)
+        for spec, key, frame in self.iter_results(specs):
+            frames[key].append(frame)
+        return {key: fs[0] if len(fs) == 1 else pd.concat(fs) for key, fs in frames.items()}
+
+    @property
+    def stats(self):
+        """:return: DataFrame of requests, rows, bytes, busy seconds and throughput per worker process"""
+        rows = [WorkerStats(pid, *s) for pid, s in self._stats.items()]
+        frame = pd.DataFrame(rows, columns=WorkerStats._fields).set_index('pid')
+        frame['rows_per_sec'] = frame['rows'] / frame['seconds'].where(frame['seconds'] > 0)
+        return frame
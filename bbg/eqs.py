@@ -59,20 +59,28 @@ class EQSRequest(Request):
         overrides and self.apply_overrides(request, overrides)
         return request
 
-    def on_security_node(self, node):
+    def parse_security_node(self, node):
         sid = XmlHelper.get_child_value(node, 'security')
         farr = node.getElement('fieldData')
         fldnames = [str(farr.getElement(_).name()) for _ in range(farr.numElements())]
         fdata = XmlHelper.get_child_values(farr, fldnames)
-        self.response.on_security_data(sid, dict(zip(fldnames, fdata)))
-        ferrors = XmlHelper.get_field_errors(node)
-        ferrors and self.field_errors.extend(ferrors)
+        return sid, dict(zip(fldnames, fdata)), XmlHelper.get_field_errors(node)
 
-    def on_event(self, evt, is_final):
+    def parse_event(self, evt, is_final):
+        """:return: list of (sid, field map, FieldErrors) and list of SecurityErrors """
+        nodes, security_errors = [], []
         for msg in XmlHelper.message_iter(evt):
             data = msg.getElement('data')
             for node, error in XmlHelper.security_iter(data.getElement('securityData')):
                 if error:
-                    self.security_errors.append(error)
+                    security_errors.append(error)
                 else:
-                    self.on_security_node(node)
+                    nodes.append(self.parse_security_node(node))
+        return nodes, security_errors
+
+    def on_parsed(self, parsed, is_final):
+        nodes, security_errors = parsed
+        self.security_errors.extend(security_errors)
+        for sid, field_map, ferrors in nodes:
+            self.response.on_security_data(sid, field_map)
+            ferrors and self.field_errors.extend(ferrors)
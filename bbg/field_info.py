@@ -0,0 +1,177 @@
+import json
+import os
+import tempfile
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from bbg.request import Request
+from bbg.utils import FieldError, XmlHelper
+
+DEFAULT_FIELD_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'bbg', 'field_info.json')
+
+_path_locks = {}  # cache file path -> lock shared by the instances of the process using it
+_path_locks_lock = threading.Lock()
+
+FieldInfoAttrs = ['mnemonic', 'id', 'datatype', 'ftype', 'description']
+
+# apiflds datatype (lower case) -> numpy dtype of the parsed column. Integers are parsed as float64 so that
+# missing values can be represented as nan, as done by the untyped parsers
+DATATYPE_DTYPES = {
+    'float64': np.float64,
+    'float32': np.float64,
+    'double': np.float64,
+    'float': np.float64,
+    'decimal': np.float64,
+    'int32': np.float64,
+    'int64': np.float64,
+    'date': 'datetime64[ns]',
+}
+
+
+def normalize_mnemonic(fld):
+    """Bloomberg field mnemonics and ids are case insensitive"""
+    return fld.strip().upper()
+
+
+class FieldInfo(namedtuple('FieldInfo', FieldInfoAttrs)):
+    """Metadata of a Bloomberg field as returned by the //blp/apiflds service"""
+
+    @property
+    def is_bulk(self):
+        return self.datatype.lower() == 'sequence' or self.ftype.replace(' ', '').lower() == 'bulkformat'
+
+    @property
+    def dtype(self):
+        """numpy dtype used to store the field values"""
+        if self.is_bulk:
+            return np.dtype(object)
+        return np.dtype(DATATYPE_DTYPES.get(self.datatype.lower(), object))
+
+    @property
+    def missing_value(self):
+        kind = self.dtype.kind
+        return np.datetime64('NaT') if kind == 'M' else np.nan
+
+    @property
+    def converter(self):
+        """function converting a field Element into a value which can be stored in a column of type dtype"""
+        kind = self.dtype.kind
+        if kind == 'f':
+            return lambda ele: np.nan if ele.isNull() else ele.getValueAsFloat()
+        elif kind == 'M':
+            return lambda ele: np.datetime64('NaT') if ele.isNull() else np.datetime64(ele.getValue(), 'ns')
+        else:
+            return XmlHelper.as_value
+
+
+class FieldInfoCache(object):
+    """Persistent on-disk cache of FieldInfo, keyed by normalized mnemonic and field id"""
+
+    def __init__(self, path=DEFAULT_FIELD_CACHE_PATH):
+        self.path = path
+        with _path_locks_lock:
+            self._lock = _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+        self._infos = None
+
+    def __repr__(self):
+        return '<%s(%s)' % (self.__class__.__name__, self.path)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return {k: FieldInfo(**v) for k, v in json.load(f).items()}
+
+    def _load(self):
+        if self._infos is None:
+            self._infos = self._read()
+        return self._infos
+
+    def get(self, flds):
+        """:return: map of the specified field names to their FieldInfo, fields not in the cache are omitted"""
+        with self._lock:
+            infos = self._load()
+            return {f: infos[normalize_mnemonic(f)] for f in flds if normalize_mnemonic(f) in infos}
+
+    def missing(self, flds):
+        with self._lock:
+            infos = self._load()
+            return [f for f in flds if normalize_mnemonic(f) not in infos]
+
+    def update(self, infos):
+        """add the infos to the cache, merged with the entries other processes or instances wrote to the file"""
+        with self._lock:
+            cached = self._read()
+            cached.update(self._infos or {})
+            for info in infos:
+                cached[normalize_mnemonic(info.mnemonic)] = info
+                cached[normalize_mnemonic(info.id)] = info
+            self._infos = cached
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.path) or '.', suffix='.tmp',
+                                             delete=False) as f:
+                json.dump({k: v._asdict() for k, v in cached.items()}, f)
+            try:
+                os.replace(f.name, self.path)
+            except BaseException:
+                os.remove(f.name)
+                raise
+
+
+class FieldInfoResponse(object):
+
+    def __init__(self, request):
+        self.request = request
+        self.response_map = {}
+
+    def on_field_info(self, info):
+        self.response_map[info.mnemonic] = info
+
+    def as_map(self):
+        return self.response_map
+
+
+class FieldInfoRequest(Request):
+    """Look up the metadata of the specified fields (mnemonics or ids) with the //blp/apiflds service.
+    Unknown fields are reported as field errors."""
+
+    def __init__(self, fields, ignore_field_error=0):
+        Request.__init__(self, '//blp/apiflds', ignore_field_error=ignore_field_error)
+        self.fields = isinstance(fields, str) and [fields] or list(fields)
+
+    def __repr__(self):
+        return '<{clz}([{fields}])'.format(clz=self.__class__.__name__, fields=','.join(self.fields))
+
+    def new_response(self):
+        self.response = FieldInfoResponse(self)
+
+    def get_bbg_request(self, svc, session):
+        request = svc.createRequest('FieldInfoRequest')
+        [request.append('id', fld) for fld in self.fields]
+        request.set('returnFieldDocumentation', False)
+        return request
+
+    @staticmethod
+    def parse_field_node(node):
+        fid = XmlHelper.get_child_value(node, 'id')
+        if node.hasElement('fieldError'):
+            err = node.getElement('fieldError')
+            vals = XmlHelper.get_child_values(err, ['source', 'code', 'category', 'message', 'subcategory'])
+            return None, FieldError(None, fid, *vals)
+        info = node.getElement('fieldInfo')
+        vals = XmlHelper.get_child_values(info, ['mnemonic', 'datatype', 'ftype', 'description'])
+        mnemonic, datatype, ftype, desc = [isinstance(v, str) and v or '' for v in vals]
+        return FieldInfo(mnemonic=mnemonic, id=fid, datatype=datatype, ftype=ftype, description=desc), None
+
+    def parse_event(self, evt, is_final):
+        return [self.parse_field_node(node) for msg in XmlHelper.message_iter(evt)
+                for node in XmlHelper.node_iter(msg.getElement('fieldData'))]
+
+    def on_parsed(self, parsed, is_final):
+        for info, error in parsed:
+            if error:
+                self.field_errors.append(error)
+            else:
+                self.response.on_field_info(info)
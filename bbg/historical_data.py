@@ -1,8 +1,11 @@
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 
 from bbg.request import Request
+from bbg.sink import FrameStore
+from bbg.template import get_template
 from bbg.utils import XmlHelper
 
 
@@ -11,18 +14,29 @@ class HistoricalDataResponse(object):
     def __init__(self, request):
         self.request = request
         self.response_map = {}
+        self.store = request.sink
+        self.sids = []
 
     def on_security_complete(self, sid, frame):
-        self.response_map[sid] = frame
+        if self.store is None:
+            self.response_map[sid] = frame
+        else:
+            # streamed to disk, only the security is kept
+            self.store.write(sid, frame)
+            self.sids.append(sid)
 
     def as_panel(self):
-        return pd.Panel(self.response_map)
+        return pd.Panel(self.as_map())
 
     def as_map(self):
+        if self.store is not None:
+            return self.store.as_map(self.sids)
         return self.response_map
 
     def as_frame(self):
         """ :return: Multi-Index DataFrame """
+        if self.store is not None:
+            return self.store.as_frame(self.sids)
         sids, frames = self.response_map.keys(), self.response_map.values()
         frame = pd.concat(frames, keys=sids, axis=1)
         return frame
@@ -50,13 +64,18 @@ class HistoricalDataRequest(Request):
     non_trading_day_fill_option: (NON_TRADING_WEEKDAYS | ALL_CALENDAR_DAYS | ACTIVE_DAYS_ONLY)
     non_trading_day_fill_method: (PREVIOUS_VALUE | NIL_VALUE)
     calendar_code_override: 2 letter county iso code
+    field_info: (optional) map of field name to FieldInfo (see Terminal.get_field_info). Fields with a known
+                datatype are parsed straight into typed numpy columns instead of object columns
+    sink: (optional) FrameStore or directory path. If set, each security frame is written to the store as soon
+          as it is complete instead of being kept in memory, see HistoricalDataResponse.store
     """
 
     def __init__(self, sids, fields, start=None, end=None, period=None, ignore_security_error=0,
                  ignore_field_error=0, period_adjustment=None, currency=None, override_option=None,
                  pricing_option=None, non_trading_day_fill_option=None, non_trading_day_fill_method=None,
                  max_data_points=None, adjustment_normal=None, adjustment_abnormal=None, adjustment_split=None,
-                 adjustment_follow_DPDF=None, calendar_code_override=None, **overrides):
+                 adjustment_follow_DPDF=None, calendar_code_override=None, field_info=None, sink=None,
+                 **overrides):
 
         Request.__init__(self, '//blp/refdata', ignore_security_error=ignore_security_error,
                          ignore_field_error=ignore_field_error)
@@ -81,6 +100,8 @@ class HistoricalDataRequest(Request):
         self.adjustment_split = adjustment_split
         self.adjustment_follow_DPDF = adjustment_follow_DPDF
         self.calendar_code_override = calendar_code_override
+        self.field_info = field_info or {}
+        self.sink = isinstance(sink, str) and FrameStore(sink) or sink
         self.overrides = overrides
 
     def __repr__(self):
@@ -97,33 +118,33 @@ class HistoricalDataRequest(Request):
     def new_response(self):
         self.response = HistoricalDataResponse(self)
 
+    @property
+    def template(self):
+        settings = dict(periodicitySelection=self.period,
+                        periodicityAdjustment=self.period_adjustment,
+                        currency=self.currency,
+                        overrideOption=self.override_option,
+                        pricingOption=self.pricing_option,
+                        nonTradingDayFillOption=self.non_trading_day_fill_option,
+                        nonTradingDayFillMethod=self.non_trading_day_fill_method,
+                        maxDataPoints=self.max_data_points,
+                        calendarCodeOverride=self.calendar_code_override)
+        flags = dict(adjustmentNormal=self.adjustment_normal,
+                     adjustmentAbnormal=self.adjustment_abnormal,
+                     adjustmentSplit=self.adjustment_split,
+                     adjustmentFollowDPDF=self.adjustment_follow_DPDF)
+        return get_template('HistoricalDataRequest', self.fields, settings, flags, self.overrides)
+
     def get_bbg_request(self, svc, session):
-        # create the bloomberg request object
-        request = svc.createRequest('HistoricalDataRequest')
-        [request.append('securities', sec) for sec in self.sids]
-        [request.append('fields', fld) for fld in self.fields]
-        request.set('startDate', self.start.strftime('%Y%m%d'))
-        request.set('endDate', self.end.strftime('%Y%m%d'))
-        request.set('periodicitySelection', self.period)
-        self.period_adjustment and request.set('periodicityAdjustment', self.period_adjustment)
-        self.currency and request.set('currency', self.currency)
-        self.override_option and request.set('overrideOption', self.override_option)
-        self.pricing_option and request.set('pricingOption', self.pricing_option)
-        self.non_trading_day_fill_option and request.set('nonTradingDayFillOption', self.non_trading_day_fill_option)
-        self.non_trading_day_fill_method and request.set('nonTradingDayFillMethod', self.non_trading_day_fill_method)
-        self.max_data_points and request.set('maxDataPoints', self.max_data_points)
-        self.calendar_code_override and request.set('calendarCodeOverride', self.calendar_code_override)
-        self.set_flag(request, self.adjustment_normal, 'adjustmentNormal')
-        self.set_flag(request, self.adjustment_abnormal, 'adjustmentAbnormal')
-        self.set_flag(request, self.adjustment_split, 'adjustmentSplit')
-        self.set_flag(request, self.adjustment_follow_DPDF, 'adjustmentFollowDPDF')
-
-        if hasattr(self, 'overrides') and self.overrides is not None:
-            Request.apply_overrides(request, self.overrides)
-        return request
-
-    def on_security_data_node(self, node):
+        # create the bloomberg request object, only the securities and dates vary between requests
+        return self.template.create(svc, self.sids,
+                                    startDate=self.start.strftime('%Y%m%d'),
+                                    endDate=self.end.strftime('%Y%m%d'))
+
+    def parse_security_data_node(self, node):
         """process a securityData node - FIXME: currently not handling relateDate node """
+        if self.field_info:
+            return self.parse_typed_security_data_node(node)
         sid = XmlHelper.get_child_value(node, 'security')
         farr = node.getElement('fieldData')
         dmap = defaultdict(list)
@@ -137,14 +158,51 @@ class HistoricalDataRequest(Request):
             idx = dmap.pop('date')
             frame = pd.DataFrame(dmap, columns=self.fields, index=idx)
             frame.index.name = 'date'
-        self.response.on_security_complete(sid, frame)
+        return sid, frame
 
-    def on_event(self, evt, is_final):
+    def parse_typed_security_data_node(self, node):
+        """process a securityData node into columns preallocated with the dtypes given by field_info"""
+        sid = XmlHelper.get_child_value(node, 'security')
+        farr = node.getElement('fieldData')
+        n = farr.numValues()
+        if not n:
+            return sid, pd.DataFrame(columns=self.fields)
+
+        dates = np.empty(n, dtype='datetime64[ns]')
+        columns = []
+        for f in self.fields:
+            info = self.field_info.get(f)
+            if info is None:
+                columns.append((f, np.full(n, np.nan, dtype=object), XmlHelper.as_value))
+            else:
+                columns.append((f, np.full(n, info.missing_value, dtype=info.dtype), info.converter))
+        for i in range(n):
+            pt = farr.getValue(i)
+            dates[i] = np.datetime64(pt.getElementAsDatetime('date'), 'ns')
+            for f, arr, convert in columns:
+                if pt.hasElement(f):
+                    arr[i] = convert(pt.getElement(f))
+        index = pd.DatetimeIndex(dates, name='date')
+        frame = pd.DataFrame({f: arr for f, arr, _ in columns}, columns=self.fields, index=index)
+        return sid, frame
+
+    def parse_event(self, evt, is_final):
+        """:return: list of (sid, frame, SecurityError) where either the frame or the error is None """
+        parsed = []
         for msg in XmlHelper.message_iter(evt):
             # Single security element in historical request
             node = msg.getElement('securityData')
             if node.hasElement('securityError'):
                 sid = XmlHelper.get_child_value(node, 'security')
-                self.security_errors.append(XmlHelper.as_security_error(node.getElement('securityError'), sid))
+                parsed.append((sid, None, XmlHelper.as_security_error(node.getElement('securityError'), sid)))
+            else:
+                sid, frame = self.parse_security_data_node(node)
+                parsed.append((sid, frame, None))
+        return parsed
+
+    def on_parsed(self, parsed, is_final):
+        for sid, frame, error in parsed:
+            if error:
+                self.security_errors.append(error)
             else:
-                self.on_security_data_node(node)
+                self.response.on_security_complete(sid, frame)
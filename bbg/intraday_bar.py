@@ -1,6 +1,8 @@
 import pandas as pd
 
+from bbg.compact import CompactRecords, records_memory_usage
 from bbg.request import Request
+from bbg.resample import rollup_bars
 from bbg.utils import XmlHelper
 
 
@@ -9,16 +11,43 @@ class IntradayBarResponse(object):
     def __init__(self, request):
         self.request = request
         self.bars = []  # array of dicts
+        self.compact = None
+        if request.compact:
+            self.compact = CompactRecords(price_columns=['open', 'high', 'low', 'close'],
+                                          size_columns=['volume', 'numEvents'],
+                                          float32_prices=request.float32_prices, int32_sizes=request.int32_sizes)
+
+    def on_bar_data(self, barmaps):
+        if self.compact is None:
+            self.bars.extend(barmaps)
+        else:
+            self.compact.append(barmaps)
 
     def as_frame(self):
+        if self.compact is not None:
+            return self.compact.as_frame()
         return pd.DataFrame.from_records(self.bars)
 
+    def memory_usage(self):
+        """:return: Series of the bytes held by the response for each column"""
+        if self.compact is not None:
+            return self.compact.memory_usage()
+        return records_memory_usage(self.bars)
+
+    def resample(self, interval, origin=None):
+        """Roll the bars up locally into bars of the specified interval (minutes or Timedelta), which must be a
+        multiple of the requested interval. See bbg.resample.rollup_bars"""
+        ratio = pd.Timedelta(minutes=interval) if isinstance(interval, int) else pd.Timedelta(interval)
+        assert ratio % pd.Timedelta(minutes=self.request.interval or 1) == pd.Timedelta(0), \
+            'interval must be a multiple of the requested interval'
+        return rollup_bars(self.as_frame(), interval, origin=origin)
+
 
 class IntradayBarRequest(Request):
 
     def __init__(self, sid, start=None, end=None, event='TRADE', interval=None, gap_fill_initial_bar=None,
                  return_eids=None, adjustment_normal=None, adjustment_abnormal=None, adjustment_split=None,
-                 adjustment_follow_dpdf=None):
+                 adjustment_follow_dpdf=None, compact=False, float32_prices=False, int32_sizes=False):
         """
         Parameters
         ----------
@@ -26,6 +55,9 @@ class IntradayBarRequest(Request):
         interval: int, between 1 and 1440 in minutes. If omitted, defaults to 1 minute
         gap_fill_initial_bar: bool
                             If True, bar contains previous values if not ticks during the interval
+        compact: If True, bars are stored as numpy columns with int64 nanosecond times instead of a list of dicts
+        float32_prices: If compact, store open, high, low and close as float32
+        int32_sizes: If compact, store volume and numEvents as int32
         """
         Request.__init__(self, '//blp/refdata')
         self.sid = sid
@@ -37,6 +69,9 @@ class IntradayBarRequest(Request):
         self.adjustment_abnormal = adjustment_abnormal
         self.adjustment_split = adjustment_split
         self.adjustment_follow_DPDF = adjustment_follow_dpdf
+        self.compact = compact
+        self.float32_prices = float32_prices
+        self.int32_sizes = int32_sizes
         self.end = end = pd.to_datetime(end) if end else pd.to_datetime('now')
         self.start = pd.to_datetime(start) if start else end + pd.DateOffset(hours=-1)
 
@@ -68,16 +103,23 @@ class IntradayBarRequest(Request):
         self.set_flag(request, self.adjustment_follow_DPDF, 'adjustmentFollowDPDF')
         return request
 
-    def on_bar_data(self, bars):
-        """Process the incoming tick data array"""
+    @staticmethod
+    def parse_bar_data(bars):
+        """Process the incoming bar data array"""
+        barmaps = []
         for tick in XmlHelper.node_iter(bars):
             names = [str(tick.getElement(_).name()) for _ in range(tick.numElements())]
-            barmap = {n: XmlHelper.get_child_value(tick, n) for n in names}
-            self.response.bars.append(barmap)
+            barmaps.append({n: XmlHelper.get_child_value(tick, n) for n in names})
+        return barmaps
 
-    def on_event(self, evt, is_final):
+    def parse_event(self, evt, is_final):
+        barmaps = []
         for msg in XmlHelper.message_iter(evt):
             data = msg.getElement('barData')
-            # tickData will have 0 to 1 tickData[] elements
+            # barData will have 0 to 1 barTickData[] elements
             if data.hasElement('barTickData'):
-                self.on_bar_data(data.getElement('barTickData'))
+                barmaps.extend(self.parse_bar_data(data.getElement('barTickData')))
+        return barmaps
+
+    def on_parsed(self, parsed, is_final):
+        self.response.on_bar_data(parsed)
@@ -1,6 +1,8 @@
 import pandas as pd
 
+from bbg.compact import CompactRecords, records_memory_usage
 from bbg.request import Request
+from bbg.resample import bars_from_ticks
 from bbg.utils import XmlHelper
 
 
@@ -9,21 +11,49 @@ class IntradayTickResponse(object):
     def __init__(self, request):
         self.request = request
         self.ticks = []  # array of dicts
+        self.compact = None
+        if request.compact:
+            self.compact = CompactRecords(price_columns=['value'], size_columns=['size'],
+                                          float32_prices=request.float32_prices, int32_sizes=request.int32_sizes)
+
+    def on_tick_data(self, tickmaps):
+        if self.compact is None:
+            self.ticks.extend(tickmaps)
+        else:
+            self.compact.append(tickmaps)
 
     def as_frame(self):
         """Return a data frame with no set index"""
+        if self.compact is not None:
+            return self.compact.as_frame()
         return pd.DataFrame.from_records(self.ticks)
 
+    def memory_usage(self):
+        """:return: Series of the bytes held by the response for each column"""
+        if self.compact is not None:
+            return self.compact.memory_usage()
+        return records_memory_usage(self.ticks)
+
+    def as_bars(self, interval, event='TRADE', origin=None):
+        """Build bars of the specified interval (minutes or Timedelta) from the ticks of type event.
+        See bbg.resample.bars_from_ticks"""
+        return bars_from_ticks(self.as_frame(), interval, event=event, origin=origin)
+
 
 class IntradayTickRequest(Request):
 
     def __init__(self, sid, start=None, end=None, events='TRADE', include_condition_codes=None,
                  include_non_plottable_events=None, include_exchange_codes=None, return_eids=None,
-                 include_broker_codes=None, include_rsp_codes=None, include_bic_mic_codes=None):
+                 include_broker_codes=None, include_rsp_codes=None, include_bic_mic_codes=None, compact=False,
+                 float32_prices=False, int32_sizes=False):
         """
         Parameters
         ----------
         events: array containing any of (TRADE, BID, ASK, BID_BEST, ASK_BEST, MID_PRICE, AT_TRADE, BEST_BID, BEST_ASK)
+        compact: If True, ticks are stored as numpy columns with int64 nanosecond times and dictionary encoded
+                 type, conditionCodes and exchangeCode instead of a list of dicts
+        float32_prices: If compact, store the tick value as float32
+        int32_sizes: If compact, store the tick size as int32
         """
         Request.__init__(self, '//blp/refdata')
         self.sid = sid
@@ -35,6 +65,9 @@ class IntradayTickRequest(Request):
         self.include_broker_codes = include_broker_codes
         self.include_rsp_codes = include_rsp_codes
         self.include_bic_mic_codes = include_bic_mic_codes
+        self.compact = compact
+        self.float32_prices = float32_prices
+        self.int32_sizes = int32_sizes
         self.end = end = pd.to_datetime(end) if end else pd.to_datetime('now')
         self.start = pd.to_datetime(start) if start else end + pd.DateOffset(hours=-1)
 
@@ -65,16 +98,23 @@ class IntradayTickRequest(Request):
         self.set_flag(request, self.include_bic_mic_codes, 'includeBicMicCodes')
         return request
 
-    def on_tick_data(self, ticks):
+    @staticmethod
+    def parse_tick_data(ticks):
         """Process the incoming tick data array"""
+        tickmaps = []
         for tick in XmlHelper.node_iter(ticks):
             names = [str(tick.getElement(_).name()) for _ in range(tick.numElements())]
-            tickmap = {n: XmlHelper.get_child_value(tick, n) for n in names}
-            self.response.ticks.append(tickmap)
+            tickmaps.append({n: XmlHelper.get_child_value(tick, n) for n in names})
+        return tickmaps
 
-    def on_event(self, evt, is_final):
+    def parse_event(self, evt, is_final):
+        tickmaps = []
         for msg in XmlHelper.message_iter(evt):
             tdata = msg.getElement('tickData')
             # tickData will have 0 to 1 tickData[] elements
             if tdata.hasElement('tickData'):
-                self.on_tick_data(tdata.getElement('tickData'))
+                tickmaps.extend(self.parse_tick_data(tdata.getElement('tickData')))
+        return tickmaps
+
+    def on_parsed(self, parsed, is_final):
+        self.response.on_tick_data(parsed)
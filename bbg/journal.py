@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from bbg.distributed import intraday_tick_specs
+from bbg.historical_data import HistoricalDataRequest
+from bbg.intraday_tick import IntradayTickRequest
+from bbg.logger import LOGGER
+
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _options_digest(options):
+    """Stable digest of the request options (period, currency, overrides...), '' if all are defaulted (None)"""
+    options = dict((k, v) for k, v in (options or {}).items() if v is not None)
+    if not options:
+        return ''
+    return hashlib.sha1(json.dumps(options, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def unit_key(kind, sid, fields, start, end, options=None):
+    """Key of a unit of work: a security, its fields, a date range and a digest of the other request options, so
+    that a journal reused with different options does not count the units as done"""
+    fields = isinstance(fields, str) and [fields] or fields or []
+
+    def fmt(d):
+        return d is not None and d.strftime('%Y%m%dT%H%M%S') or ''
+
+    key = '%s|%s|%s|%s|%s' % (kind, sid, ','.join(fields), fmt(start), fmt(end))
+    digest = _options_digest(options)
+    return digest and '%s|%s' % (key, digest) or key
+
+
+class JobJournal(object):
+    """Append-only journal (one json record per line) of the units of a bulk job which completed, and where their
+    output lives, or failed. Reopening the journal of an interrupted job tells which units are left to do.
+
+    A unit is given up after a persistent failure (e.g. an invalid security) or after max_attempts transient
+    failures (e.g. session drops), so that it is not retried forever.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.units = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        pass  # truncated last line of an interrupted job
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def __repr__(self):
+        return '<{clz}({path})'.format(clz=self.__class__.__name__, path=self.path)
+
+    def _apply(self, record):
+        unit = self.units.setdefault(record['unit'], dict(status=None, attempts=0))
+        unit.update(record)
+        if record['status'] == FAILED:
+            unit['attempts'] += 1
+
+    def _record(self, key, **record):
+        record = dict(record, unit=key, time=time.time())
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+            self._apply(record)
+
+    def record_done(self, key, output, field_errors=None):
+        self._record(key, status=DONE, output=output, field_errors=[e._asdict() for e in field_errors or []])
+
+    def record_failure(self, key, error, persistent=False):
+        """error: SecurityError / FieldError or exception"""
+        error = hasattr(error, '_asdict') and error._asdict() or repr(error)
+        self._record(key, status=FAILED, error=error, persistent=persistent)
+
+    def is_done(self, key):
+        return self.units.get(key, {}).get('status') == DONE
+
+    def is_given_up(self, key):
+        unit = self.units.get(key, {})
+        return unit.get('status') == FAILED and (unit.get('persistent') or unit['attempts'] >= self.max_attempts)
+
+    def pending(self, keys):
+        return [k for k in keys if not self.is_done(k) and not self.is_given_up(k)]
+
+    def output(self, key):
+        return self.units[key]['output']
+
+    def summary(self):
+        """:return: count of units done, given up and failed (to be retried)"""
+        counts = dict(done=0, given_up=0, failed=0)
+        for key, unit in self.units.items():
+            if unit['status'] == DONE:
+                counts['done'] += 1
+            elif self.is_given_up(key):
+                counts['given_up'] += 1
+            else:
+                counts['failed'] += 1
+        return counts
+
+
+def run_historical(terminal, journal, store, sids, fields, start=None, end=None, chunk_size=50, **kwargs):
+    """Resumable get_historical writing each security to the FrameStore store. Securities already done (or given up)
+    in the journal are skipped, invalid securities are recorded as persistent failures.
+
+    :return: the journal summary
+    """
+    sids = isinstance(sids, str) and [sids] or list(sids)
+    probe = HistoricalDataRequest(sids[:1], fields, start=start, end=end)
+    # historical requests only use the dates, and defaulted ones (from now) must give the same keys on a restart
+    probe.start, probe.end = probe.start.normalize(), probe.end.normalize()
+    keys = {sid: unit_key('historical', sid, probe.fields, probe.start, probe.end, kwargs) for sid in sids}
+    todo = [sid for sid in sids if journal.pending([keys[sid]])]
+    LOGGER.info('%s: %s of %s securities left to fetch' % (journal, len(todo), len(sids)))
+    for i in range(0, len(todo), chunk_size):
+        chunk = todo[i:i + chunk_size]
+        req = HistoricalDataRequest(chunk, fields, start=probe.start, end=probe.end, ignore_security_error=1,
+                                    ignore_field_error=1, sink=store, **kwargs)
+        try:
+            response = terminal.execute(req)
+        except Exception as e:
+            LOGGER.warning('%s: chunk of %s securities failed: %s' % (journal, len(chunk), e))
+            [journal.record_failure(keys[sid], e) for sid in chunk]
+            continue
+        for sid in response.sids:
+            ferrors = [e for e in req.field_errors if e.security == sid]
+            journal.record_done(keys[sid], store.file_path(sid), field_errors=ferrors)
+        for error in req.security_errors:
+            error.security in keys and journal.record_failure(keys[error.security], error, persistent=True)
+        missing = set(chunk) - set(response.sids) - set(e.security for e in req.security_errors)
+        [journal.record_failure(keys[sid], Exception('no data returned')) for sid in missing]
+    return journal.summary()
+
+
+def run_intraday_tick(terminal, journal, store, sids, start, end, freq='1D', **kwargs):
+    """Resumable tick backfill split in one unit per security and period of length freq, each written to the
+    FrameStore store. Units already done (or given up) in the journal are skipped.
+
+    :return: the journal summary
+    """
+    specs = intraday_tick_specs(sids, start, end, freq=freq, **kwargs)
+    keys = [unit_key('intraday_tick', spec.args[0], None, spec.kwargs['start'], spec.kwargs['end'], kwargs)
+            for spec in specs]
+    todo = [(spec, key) for spec, key in zip(specs, keys) if journal.pending([key])]
+    LOGGER.info('%s: %s of %s units left to fetch' % (journal, len(todo), len(specs)))
+    for spec, key in todo:
+        try:
+            response = terminal.execute(IntradayTickRequest(*spec.args, **spec.kwargs))
+            journal.record_done(key, store.write(key, response.as_frame()))
+        except Exception as e:
+            LOGGER.warning('%s: %s failed: %s' % (journal, key, e))
+            journal.record_failure(key, e)
+    return journal.summary()
@@ -1,8 +1,10 @@
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 
 from bbg.request import Request
+from bbg.template import get_template
 from bbg.utils import XmlHelper
 
 
@@ -24,15 +26,20 @@ class ReferenceDataResponse(object):
         frame = pd.DataFrame.from_dict(data, orient='index')
         # layer in any missing fields just in case
         frame = frame.reindex_axis(self.request.fields, axis=1)
+        for fld, info in self.request.field_info.items():
+            if fld in frame and info.dtype.kind in 'fM':
+                frame[fld] = frame[fld].astype(info.dtype)
         return frame
 
 
 class ReferenceDataRequest(Request):
 
     def __init__(self, sids, fields, ignore_security_error=0, ignore_field_error=0, return_formatted_value=None,
-                 use_utc_time=None, **overrides):
+                 use_utc_time=None, field_info=None, **overrides):
         """
         response_type: (frame, map) how to return the results
+        field_info: (optional) map of field name to FieldInfo (see Terminal.get_field_info). Fields with a known
+                    datatype are converted without datatype dispatch and returned in typed columns
         """
         Request.__init__(self, '//blp/refdata', ignore_security_error=ignore_security_error,
                          ignore_field_error=ignore_field_error)
@@ -42,6 +49,8 @@ class ReferenceDataRequest(Request):
         self.fields = isinstance(fields, str) and [fields] or fields
         self.return_formatted_value = return_formatted_value
         self.use_utc_time = use_utc_time
+        self.field_info = field_info or {}
+        self.converters = [f in self.field_info and self.field_info[f].converter or None for f in self.fields]
         self.overrides = overrides
 
     def __repr__(self):
@@ -54,29 +63,40 @@ class ReferenceDataRequest(Request):
     def new_response(self):
         self.response = ReferenceDataResponse(self)
 
+    @property
+    def template(self):
+        flags = dict(returnFormattedValue=self.return_formatted_value, useUTCTime=self.use_utc_time)
+        return get_template('ReferenceDataRequest', self.fields, flags=flags, overrides=self.overrides)
+
     def get_bbg_request(self, svc, session):
-        # create the bloomberg request object
-        request = svc.createRequest('ReferenceDataRequest')
-        [request.append('securities', sec) for sec in self.sids]
-        [request.append('fields', fld) for fld in self.fields]
-        self.set_flag(request, self.return_formatted_value, 'returnFormattedValue')
-        self.set_flag(request, self.use_utc_time, 'useUTCTime')
-        Request.apply_overrides(request, self.overrides)
-        return request
-
-    def on_security_node(self, node):
+        # create the bloomberg request object, only the securities vary between requests
+        return self.template.create(svc, self.sids)
+
+    def parse_security_node(self, node):
         sid = XmlHelper.get_child_value(node, 'security')
         farr = node.getElement('fieldData')
-        fdata = XmlHelper.get_child_values(farr, self.fields)
+        if self.field_info:
+            fdata = [(convert or XmlHelper.as_value)(farr.getElement(f)) if farr.hasElement(f) else np.nan
+                     for f, convert in zip(self.fields, self.converters)]
+        else:
+            fdata = XmlHelper.get_child_values(farr, self.fields)
         assert len(fdata) == len(self.fields), 'field length must match data length'
-        self.response.on_security_data(sid, dict(zip(self.fields, fdata)))
-        ferrors = XmlHelper.get_field_errors(node)
-        ferrors and self.field_errors.extend(ferrors)
+        return sid, dict(zip(self.fields, fdata)), XmlHelper.get_field_errors(node)
 
-    def on_event(self, evt, is_final):
+    def parse_event(self, evt, is_final):
+        """:return: list of (sid, field map, FieldErrors) and list of SecurityErrors """
+        nodes, security_errors = [], []
         for msg in XmlHelper.message_iter(evt):
             for node, error in XmlHelper.security_iter(msg.getElement('securityData')):
                 if error:
-                    self.security_errors.append(error)
+                    security_errors.append(error)
                 else:
-                    self.on_security_node(node)
+                    nodes.append(self.parse_security_node(node))
+        return nodes, security_errors
+
+    def on_parsed(self, parsed, is_final):
+        nodes, security_errors = parsed
+        self.security_errors.extend(security_errors)
+        for sid, field_map, ferrors in nodes:
+            self.response.on_security_data(sid, field_map)
+            ferrors and self.field_errors.extend(ferrors)
@@ -1,3 +1,6 @@
+import threading
+
+
 class Request(object):
 
     def __init__(self, svc_name, ignore_security_error=0, ignore_field_error=0):
@@ -7,6 +10,21 @@ class Request(object):
         self.ignore_field_error = ignore_field_error
         self.svc_name = svc_name
         self.response = None
+        self.is_complete = False  # False while executing or if a partial response was returned
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Ask the terminal executing the request (possibly from another thread) to cancel it"""
+        self._cancelled.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def clear_errors(self):
+        """Forget the errors collected so far, e.g. before the request is re-issued"""
+        del self.field_errors[:]
+        del self.security_errors[:]
 
     def new_response(self):
         raise NotImplementedError('subclass must implement')
@@ -31,6 +49,15 @@ class Request(object):
         raise NotImplementedError()
 
     def on_event(self, evt, is_final):
+        self.on_parsed(self.parse_event(evt, is_final), is_final)
+
+    def parse_event(self, evt, is_final):
+        """Convert a (PARTIAL_)RESPONSE event into python objects. May run on a parser thread so it must not
+        modify the request or the response, which is left to on_parsed"""
+        raise NotImplementedError()
+
+    def on_parsed(self, parsed, is_final):
+        """Store the result of parse_event into the response. Called in the order the events were received"""
         raise NotImplementedError()
 
     def on_admin_event(self, evt):
@@ -39,8 +66,9 @@ class Request(object):
     @staticmethod
     def apply_overrides(request, overrides):
         if overrides:
+            ovrds = request.getElement('overrides')
             for k, v in overrides.items():
-                o = request.getElement('overrides').appendElement()
+                o = ovrds.appendElement()
                 o.setElement('fieldId', k)
                 o.setElement('value', v)
 
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from bbg.utils import datetime_to_ns, ns_to_datetime
+
+BAR_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume', 'numEvents', 'value']
+
+
+def _interval_ns(interval):
+    """interval in minutes (int) or anything pandas can turn into a Timedelta"""
+    if isinstance(interval, (int, np.integer)):
+        interval = pd.Timedelta(minutes=int(interval))
+    ns = int(pd.Timedelta(interval).value)
+    assert ns > 0, 'interval must be positive'
+    return ns
+
+
+def _buckets(ns, interval, origin):
+    """:return: (bar start times in ns, index of the first row of each bar, index of the last row of each bar)"""
+    step = _interval_ns(interval)
+    origin = 0 if origin is None else int(datetime_to_ns([origin])[0][0])
+    keys = (ns - origin) // step
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(ns)] - 1
+    return origin + keys[starts] * step, starts, ends
+
+
+def _widen(values):
+    """sum narrow (e.g. int32 compact) columns in 64 bits to avoid overflows"""
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64)
+    elif values.dtype.kind == 'f':
+        return values.astype(np.float64)
+    return values
+
+
+def _sorted(frame):
+    ns, tz = datetime_to_ns(frame['time'])
+    if len(ns) > 1 and (np.diff(ns) < 0).any():
+        order = np.argsort(ns, kind='stable')
+        return frame.iloc[order], ns[order], tz
+    return frame, ns, tz
+
+
+def rollup_bars(bars, interval, origin=None):
+    """Aggregate a frame of bars (see IntradayBarResponse.as_frame) into bars of the specified interval, so that a
+    single 1 minute bar request can serve every interval. Vectorized, no per-row python work.
+
+    Parameters
+    ----------
+    bars: DataFrame with the columns time, open, high, low, close, volume, numEvents, value
+    interval: int minutes, or a Timedelta / string such as '90s'. Must be a multiple of the source interval
+    origin: (optional) datetime the bars are aligned to. If None, bars are aligned to the clock (epoch)
+    """
+    if bars.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    bars, ns, tz = _sorted(bars)
+    times, starts, ends = _buckets(ns, interval, origin)
+
+    def col(c):
+        return bars[c].to_numpy()
+
+    return pd.DataFrame({
+        'time': ns_to_datetime(times, tz),
+        'open': col('open')[starts],
+        'high': np.maximum.reduceat(col('high'), starts),
+        'low': np.minimum.reduceat(col('low'), starts),
+        'close': col('close')[ends],
+        'volume': np.add.reduceat(_widen(col('volume')), starts),
+        'numEvents': np.add.reduceat(_widen(col('numEvents')), starts),
+        'value': np.add.reduceat(_widen(col('value')), starts),
+    }, columns=BAR_COLUMNS)
+
+
+def bars_from_ticks(ticks, interval, event='TRADE', origin=None):
+    """Build bars of the specified interval from a frame of ticks (see IntradayTickResponse.as_frame).
+
+    Parameters
+    ----------
+    ticks: DataFrame with the columns time, value, size and optionally type
+    interval: int minutes, or a Timedelta / string such as '30s'
+    event: only use the ticks of this type. If None, all the ticks are used
+    origin: (optional) datetime the bars are aligned to. If None, bars are aligned to the clock (epoch)
+    """
+    if event is not None and 'type' in ticks:
+        ticks = ticks[ticks['type'].to_numpy() == event]
+    if ticks.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    ticks, ns, tz = _sorted(ticks)
+    times, starts, ends = _buckets(ns, interval, origin)
+    price = ticks['value'].to_numpy(dtype=float)
+    size = _widen(ticks['size'].to_numpy())
+    return pd.DataFrame({
+        'time': ns_to_datetime(times, tz),
+        'open': price[starts],
+        'high': np.maximum.reduceat(price, starts),
+        'low': np.minimum.reduceat(price, starts),
+        'close': price[ends],
+        'volume': np.add.reduceat(size, starts),
+        'numEvents': np.diff(np.r_[starts, len(ns)]),
+        'value': np.add.reduceat(price * size, starts),
+    }, columns=BAR_COLUMNS)
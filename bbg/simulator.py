@@ -0,0 +1,508 @@
+import datetime
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+import blpapi
+import numpy as np
+import pandas as pd
+
+from bbg.terminal import SyncSubscription, Terminal
+
+# blpapi.DataType values, as used by XmlHelper.as_value
+BOOL, INT64, FLOAT64, STRING, DATE, DATETIME, ENUMERATION, SEQUENCE = 1, 5, 7, 8, 10, 13, 14, 15
+
+
+class SimElement(object):
+    """Stand-in for blpapi.Element: a leaf value, an array of values / elements or a sequence of named children"""
+
+    def __init__(self, name, value=None, datatype=None, children=None, values=None):
+        self._name = str(name)
+        self._value = value
+        self._children = children  # OrderedDict name -> SimElement
+        self._values = values  # list of values or SimElements
+        if datatype is None:
+            if children is not None:
+                datatype = SEQUENCE
+            elif values is not None:
+                datatype = values and self._infer_datatype(values[0]) or STRING
+            else:
+                datatype = self._infer_datatype(value)
+        self._datatype = datatype
+
+    @staticmethod
+    def _infer_datatype(value):
+        if isinstance(value, SimElement):
+            return value.datatype()
+        if isinstance(value, bool):
+            return BOOL
+        if isinstance(value, (int, np.integer)):
+            return INT64
+        if isinstance(value, (float, np.floating)):
+            return FLOAT64
+        if isinstance(value, datetime.datetime):
+            return DATETIME
+        if isinstance(value, datetime.date):
+            return DATE
+        return STRING
+
+    @classmethod
+    def sequence(cls, name, **children):
+        return cls(name, children=OrderedDict((k, cls.wrap(k, v)) for k, v in children.items()))
+
+    @classmethod
+    def array(cls, name, values):
+        return cls(name, values=list(values))
+
+    @classmethod
+    def wrap(cls, name, value):
+        return isinstance(value, SimElement) and value or cls(name, value)
+
+    def __repr__(self):
+        return self.toString()
+
+    def name(self):
+        return self._name
+
+    def datatype(self):
+        return self._datatype
+
+    def isArray(self):
+        return self._values is not None
+
+    def isNull(self):
+        return self._children is None and self._values is None and self._value is None
+
+    def numValues(self):
+        return self._values is not None and len(self._values) or 0
+
+    def numElements(self):
+        return self._children is not None and len(self._children) or 0
+
+    def hasElement(self, name):
+        return self._children is not None and str(name) in self._children
+
+    def getElement(self, name):
+        if isinstance(name, int):
+            return list(self._children.values())[name]
+        if not self.hasElement(name):
+            raise Exception('element %s has no child %s' % (self._name, name))
+        return self._children[str(name)]
+
+    def getValue(self, index=None):
+        if index is not None:
+            return self._values[index]
+        return self._value
+
+    def getValueAsFloat(self):
+        return float(self._value)
+
+    def getValueAsString(self):
+        return str(self._value)
+
+    def getElementAsFloat(self, name):
+        return self.getElement(name).getValueAsFloat()
+
+    def getElementAsString(self, name):
+        return self.getElement(name).getValueAsString()
+
+    def getElementAsDatetime(self, name):
+        return self.getElement(name).getValue()
+
+    def toString(self):
+        if self._children is not None:
+            return '%s = {%s}' % (self._name, ' '.join(c.toString() for c in self._children.values()))
+        if self._values is not None:
+            return '%s[] = {%s}' % (self._name, ' '.join(str(v) for v in self._values))
+        return '%s = %s' % (self._name, self._value)
+
+
+class SimMessage(object):
+    """Stand-in for blpapi.Message"""
+
+    def __init__(self, message_type, element, correlation_id=None):
+        self._type = message_type
+        self._element = element
+        self._cid = correlation_id
+
+    def messageType(self):
+        return self._type
+
+    def correlationIds(self):
+        return [self._cid]
+
+    def asElement(self):
+        return self._element
+
+    def hasElement(self, name):
+        return self._element.hasElement(name)
+
+    def getElement(self, name):
+        return self._element.getElement(name)
+
+    def toString(self):
+        return '%s {%s}' % (self._type, self._element.toString())
+
+
+class SimEvent(object):
+    """Stand-in for blpapi.Event"""
+
+    def __init__(self, event_type, messages=()):
+        self._type = event_type
+        self._messages = list(messages)
+
+    def eventType(self):
+        return self._type
+
+    def __iter__(self):
+        return iter(self._messages)
+
+
+class SimRequestElement(object):
+
+    def __init__(self):
+        self.values = []
+
+    def appendValue(self, value):
+        self.values.append(value)
+
+    def appendElement(self):
+        child = SimRequestOverride()
+        self.values.append(child)
+        return child
+
+
+class SimRequestOverride(object):
+
+    def __init__(self):
+        self.elements = {}
+
+    def setElement(self, name, value):
+        self.elements[str(name)] = value
+
+
+class SimRequest(object):
+    """Stand-in for blpapi.Request, records what the request classes set"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.elements = {}
+
+    def __repr__(self):
+        return '<%s(%s, %s)' % (self.__class__.__name__, self.operation, self.elements)
+
+    def getElement(self, name):
+        return self.elements.setdefault(str(name), SimRequestElement())
+
+    def append(self, name, value):
+        self.getElement(name).appendValue(value)
+
+    def set(self, name, value):
+        self.elements[str(name)] = value
+
+    def get(self, name, default=None):
+        value = self.elements.get(name, default)
+        return value.values if isinstance(value, SimRequestElement) else value
+
+
+class SimService(object):
+
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def createRequest(self, operation):
+        return SimRequest(operation)
+
+
+class SimulatorConfig(object):
+    """Size, latency and rate of the synthetic data produced by SimulatedSession
+
+    Parameters
+    ----------
+    latency: seconds between a request being sent and its first response event
+    message_rate: maximum response messages per second. If None, as fast as they can be generated
+    messages_per_event: number of messages in each PARTIAL_RESPONSE / RESPONSE event
+    securities_per_message: securities per reference data message
+    rows_per_message: ticks or bars per intraday message
+    tick_rate: average number of ticks per second of the requested intraday range
+    max_ticks: (optional) cap of the ticks returned per request
+    invalid_sids: securities answered with a security error
+    subscription_rate: subscription updates per second across all the subscribed tickers
+    seed: seed of the random generator
+    """
+
+    def __init__(self, latency=0., message_rate=None, messages_per_event=1, securities_per_message=10,
+                 rows_per_message=1000, tick_rate=1., max_ticks=None, invalid_sids=(), subscription_rate=100.,
+                 seed=None):
+        self.latency = latency
+        self.message_rate = message_rate
+        self.messages_per_event = messages_per_event
+        self.securities_per_message = securities_per_message
+        self.rows_per_message = rows_per_message
+        self.tick_rate = tick_rate
+        self.max_ticks = max_ticks
+        self.invalid_sids = set(invalid_sids)
+        self.subscription_rate = subscription_rate
+        self.seed = seed
+
+
+def _chunks(items, n):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+def _security_error(sid):
+    err = SimElement.sequence('securityError', source='simulator', code=15, category='BAD_SEC',
+                              message='Unknown/Invalid security [nid:0]', subcategory='INVALID_SECURITY')
+    return SimElement.sequence('securityData', security=sid, securityError=err)
+
+
+class ResponseGenerator(object):
+    """Builds the synthetic messages answering a request"""
+
+    def __init__(self, config, rng):
+        self.config = config
+        self.rng = rng
+
+    def __call__(self, request):
+        handler = getattr(self, 'on_' + request.operation, None)
+        if handler is None:
+            raise Exception('simulator does not support %s' % request.operation)
+        return handler(request)
+
+    def _field_value(self, fld, base=100.):
+        if fld.upper().endswith(('NAME', 'TICKER', 'CRNCY', 'CURRENCY')):
+            return '%s_%d' % (fld, self.rng.integers(100))
+        return float(base * (1 + self.rng.normal(0, .01)))
+
+    def on_HistoricalDataRequest(self, request):
+        fields = request.get('fields')
+        dates = pd.bdate_range(pd.to_datetime(request.get('startDate')), pd.to_datetime(request.get('endDate')))
+        for seq, sid in enumerate(request.get('securities')):
+            if sid in self.config.invalid_sids:
+                yield 'HistoricalDataResponse', SimElement.sequence('root', securityData=_security_error(sid))
+                continue
+            prices = 100 * np.exp(np.cumsum(self.rng.normal(0, .01, (len(dates), len(fields))), axis=0))
+            rows = [SimElement.sequence('fieldData', date=d.date(), **dict(zip(fields, map(float, p))))
+                    for d, p in zip(dates, prices)]
+            node = SimElement.sequence('securityData', security=sid, sequenceNumber=seq,
+                                       fieldExceptions=SimElement.array('fieldExceptions', []),
+                                       fieldData=SimElement.array('fieldData', rows))
+            yield 'HistoricalDataResponse', SimElement.sequence('root', securityData=node)
+
+    def on_ReferenceDataRequest(self, request):
+        fields = request.get('fields')
+        for sids in _chunks(request.get('securities'), self.config.securities_per_message):
+            nodes = []
+            for seq, sid in enumerate(sids):
+                if sid in self.config.invalid_sids:
+                    nodes.append(_security_error(sid))
+                    continue
+                fdata = SimElement.sequence('fieldData', **{f: self._field_value(f) for f in fields})
+                nodes.append(SimElement.sequence('securityData', security=sid, sequenceNumber=seq, fieldData=fdata,
+                                                 fieldExceptions=SimElement.array('fieldExceptions', [])))
+            yield 'ReferenceDataResponse', SimElement.sequence('root',
+                                                               securityData=SimElement.array('securityData', nodes))
+
+    def on_IntradayTickRequest(self, request):
+        start, end = [pd.Timestamp(request.get(k)) for k in ('startDateTime', 'endDateTime')]
+        n = int(self.rng.poisson(max(0., (end - start).total_seconds()) * self.config.tick_rate))
+        n = self.config.max_ticks is not None and min(n, self.config.max_ticks) or n
+        # python values up front, the message building below is the hot loop
+        times = np.sort(self.rng.integers(start.value, max(end.value, start.value + 1), n))
+        times = times.astype('datetime64[ns]').astype('datetime64[us]').tolist()
+        prices = (100 * np.exp(np.cumsum(self.rng.normal(0, .0005, n)))).tolist()
+        sizes = self.rng.integers(1, 1000, n).tolist()
+        events = request.get('eventTypes')
+        types = [events[i] for i in self.rng.integers(0, len(events), n)]
+        codes = request.get('includeConditionCodes')
+        exchanges = request.get('includeExchangeCodes')
+        for rows in _chunks(range(n), self.config.rows_per_message):
+            ticks = []
+            for i in rows:
+                extra = {}
+                codes and extra.update(conditionCodes=('R6,IS', 'R6', '')[i % 3])
+                exchanges and extra.update(exchangeCode=('N', 'Q', 'P')[i % 3])
+                ticks.append(SimElement.sequence('tickData', time=times[i], type=types[i], value=prices[i],
+                                                 size=sizes[i], **extra))
+            tdata = SimElement.sequence('tickData', tickData=SimElement.array('tickData', ticks))
+            yield 'IntradayTickResponse', SimElement.sequence('root', tickData=tdata)
+
+    def on_IntradayBarRequest(self, request):
+        start, end = [pd.Timestamp(request.get(k)) for k in ('startDateTime', 'endDateTime')]
+        times = pd.date_range(start.floor('min'), end, freq='%dmin' % request.get('interval', 1), inclusive='left')
+        n = len(times)
+        close = 100 * np.exp(np.cumsum(self.rng.normal(0, .001, n)))
+        open_ = np.r_[close[:1], close[:-1]]
+        spread = np.abs(self.rng.normal(0, .001, n)) * close
+        volume = self.rng.integers(1, 100000, n)
+        events = self.rng.integers(1, 500, n)
+        for rows in _chunks(range(n), self.config.rows_per_message):
+            bars = [SimElement.sequence('barTickData', time=times[i].to_pydatetime(), open=float(open_[i]),
+                                        high=float(max(open_[i], close[i]) + spread[i]),
+                                        low=float(min(open_[i], close[i]) - spread[i]), close=float(close[i]),
+                                        volume=int(volume[i]), numEvents=int(events[i]),
+                                        value=float(close[i] * volume[i]))
+                    for i in rows]
+            bdata = SimElement.sequence('barData', barTickData=SimElement.array('barTickData', bars))
+            yield 'IntradayBarResponse', SimElement.sequence('root', barData=bdata)
+
+    def on_FieldInfoRequest(self, request):
+        nodes = []
+        for fld in request.get('id'):
+            is_str = isinstance(self._field_value(fld), str)
+            info = SimElement.sequence('fieldInfo', mnemonic=fld.upper(), datatype=is_str and 'String' or 'Float64',
+                                       ftype=is_str and 'Character' or 'Price', description=fld)
+            nodes.append(SimElement.sequence('fieldData', id=fld.upper(), fieldInfo=info))
+        yield 'fieldResponse', SimElement.sequence('root', fieldData=SimElement.array('fieldData', nodes))
+
+    def on_BeqsRequest(self, request):
+        nodes = [SimElement.sequence('securityData', security='SIM%03d US Equity' % i,
+                                     fieldData=SimElement.sequence('fieldData', Ticker='SIM%03d' % i,
+                                                                   Price=self._field_value('Price')),
+                                     fieldExceptions=SimElement.array('fieldExceptions', []))
+                 for i in range(self.config.securities_per_message)]
+        data = SimElement.sequence('data', securityData=SimElement.array('securityData', nodes))
+        yield 'BeqsResponse', SimElement.sequence('root', data=data)
+
+
+class SimulatedSession(object):
+    """Stand-in for blpapi.Session answering requests and //blp/mktdata subscriptions with synthetic data at the
+    size, latency and rate set by a SimulatorConfig, so the client can be load tested without a terminal."""
+
+    def __init__(self, config=None):
+        self.config = config or SimulatorConfig()
+        self.rng = np.random.default_rng(self.config.seed)
+        self.generator = ResponseGenerator(self.config, self.rng)
+        self._lock = threading.Lock()
+        self._admin = deque()
+        self._requests = OrderedDict()  # correlation id -> [messages iterator, next message time, peeked message]
+        self._subscriptions = []  # (correlation id, fields)
+        self._tickers = None
+        self._next_update = None
+        self._services = {}
+
+    def _admin_event(self, event_type, message_type):
+        self._admin.append(SimEvent(event_type, [SimMessage(message_type, SimElement.sequence(message_type))]))
+
+    def start(self):
+        self._admin_event(blpapi.Event.SESSION_STATUS, 'SessionStarted')
+        return True
+
+    def stop(self):
+        with self._lock:
+            self._requests.clear()
+            del self._subscriptions[:]
+        return True
+
+    def openService(self, name):
+        self._services[name] = SimService(name)
+        self._admin_event(blpapi.Event.SERVICE_STATUS, 'ServiceOpened')
+        return True
+
+    def getService(self, name):
+        return self._services[name]
+
+    def sendRequest(self, request, correlationId=None):
+        cid = correlationId or blpapi.CorrelationId()
+        messages = ((mtype, element, cid) for mtype, element in self.generator(request))
+        with self._lock:
+            self._requests[cid] = [messages, time.time() + self.config.latency, None]
+        return cid
+
+    def cancel(self, correlationId):
+        with self._lock:
+            self._requests.pop(correlationId, None)
+            self._subscriptions = [s for s in self._subscriptions if s[0] is not correlationId]
+
+    def subscribe(self, subscriptions):
+        for i in range(subscriptions.size()):
+            topic = subscriptions.topicStringAt(i)
+            fields = 'fields=' in topic and topic.split('fields=')[1].split('&')[0].split(',') or []
+            cid = subscriptions.correlationIdAt(i)
+            self._subscriptions.append((cid, fields))
+            status = SimMessage('SubscriptionStarted', SimElement.sequence('SubscriptionStarted'), cid)
+            self._admin.append(SimEvent(blpapi.Event.SUBSCRIPTION_STATUS, [status]))
+        self._next_update = time.time()
+        self._tickers = itertools.cycle(list(self._subscriptions))
+
+    def _next_response_event(self, now):
+        """:return: (event or None, time the next message is due)"""
+        next_due = None
+        with self._lock:
+            for cid, state in list(self._requests.items()):
+                messages, due, peeked = state
+                if due > now:
+                    next_due = min(due, next_due or due)
+                    continue
+                batch = peeked is not None and [peeked] or []
+                batch.extend(itertools.islice(messages, self.config.messages_per_event - len(batch)))
+                state[2] = next(messages, None)
+                if state[2] is None:
+                    del self._requests[cid]
+                    event_type = blpapi.Event.RESPONSE
+                else:
+                    state[1] = now + (self.config.message_rate and len(batch) / self.config.message_rate or 0.)
+                    event_type = blpapi.Event.PARTIAL_RESPONSE
+                return SimEvent(event_type, [SimMessage(m, e, c) for m, e, c in batch]), None
+        return None, next_due
+
+    def _next_subscription_event(self, now):
+        """:return: (event or None, time the next update is due)"""
+        if not self._subscriptions:
+            return None, None
+        if self._next_update > now:
+            return None, self._next_update
+        cid, fields = next(self._tickers)
+        self._next_update = now + 1. / self.config.subscription_rate
+        values = {f.upper(): self.generator._field_value(f) for f in fields}
+        msg = SimMessage('MarketDataEvents', SimElement.sequence('MarketDataEvents', **values), cid)
+        return SimEvent(blpapi.Event.SUBSCRIPTION_DATA, [msg]), None
+
+    def nextEvent(self, timeout=0):
+        """Return the next event, or a TIMEOUT event if none is due within timeout milliseconds (0 = forever)"""
+        give_up = timeout and time.time() + timeout / 1000. or None
+        while True:
+            if self._admin:
+                return self._admin.popleft()
+            now = time.time()
+            evt, due = self._next_response_event(now)
+            if evt is None:
+                evt, sub_due = self._next_subscription_event(now)
+                due = min([d for d in (due, sub_due) if d is not None] or [now + .05])
+            if evt is not None:
+                return evt
+            if give_up is not None:
+                if now >= give_up:
+                    return SimEvent(blpapi.Event.TIMEOUT)
+                due = min(due, give_up)
+            time.sleep(max(0., min(due, now + .05) - now))
+
+
+class SimulatedTerminal(Terminal):
+    """Terminal backed by a SimulatedSession, see SimulatorConfig"""
+
+    def __init__(self, config=None, **terminal_options):
+        self.config = config or SimulatorConfig()
+        Terminal.__init__(self, 'simulator', 0, **terminal_options)
+
+    def _create_session(self):
+        return SimulatedSession(self.config)
+
+    def check_session(self):
+        return True
+
+
+class SimulatedSubscription(SyncSubscription):
+    """SyncSubscription fed by a SimulatedSession, see SimulatorConfig"""
+
+    def __init__(self, tickers, fields, interval=None, config=None):
+        SyncSubscription.__init__(self, tickers, fields, interval=interval, host='simulator', port=0)
+        self.config = config or SimulatorConfig()
+
+    def _create_session(self):
+        return SimulatedSession(self.config)
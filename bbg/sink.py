@@ -0,0 +1,88 @@
+import os
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+
+def _write_feather(frame, path):
+    # feather only stores a default index
+    frame.reset_index().to_feather(path)
+
+
+def _read_feather(path, columns=None):
+    frame = pd.read_feather(path)
+    frame = frame.set_index(frame.columns[0])
+    return frame if columns is None else frame[columns]
+
+
+def _read_parquet(path, columns=None):
+    return pd.read_parquet(path, columns=columns)
+
+
+def _read_pickle(path, columns=None):
+    frame = pd.read_pickle(path)
+    return frame if columns is None else frame[columns]
+
+
+# format -> (file extension, writer(frame, path), reader(path, columns))
+FORMATS = {
+    'parquet': ('.parquet', lambda frame, path: frame.to_parquet(path), _read_parquet),
+    'feather': ('.feather', _write_feather, _read_feather),
+    'pickle': ('.pkl', lambda frame, path: frame.to_pickle(path), _read_pickle),
+}
+
+
+class FrameStore(object):
+    """Directory holding one file per security, used as sink by HistoricalDataResponse so that each security frame
+    is written to disk and released as soon as it is complete. Also the lazy handle used to read any subset of the
+    securities, fields and dates back.
+
+    Parameters
+    ----------
+    path: directory of the store, created if missing
+    fmt: (pickle | parquet | feather). parquet and feather need pyarrow, which is not a requirement
+    """
+
+    def __init__(self, path, fmt='pickle'):
+        assert fmt in FORMATS, 'unknown format %s' % fmt
+        self.path = path
+        self.fmt = fmt
+        self.ext, self._writer, self._reader = FORMATS[fmt]
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return '<{clz}({path}, fmt={fmt})'.format(clz=self.__class__.__name__, path=self.path, fmt=self.fmt)
+
+    def file_path(self, sid):
+        return os.path.join(self.path, quote(sid, safe='') + self.ext)
+
+    def write(self, sid, frame):
+        """Write the frame of the specified security, atomically replacing any previous one. :return: file path"""
+        path = self.file_path(sid)
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        self._writer(frame, tmp)
+        os.replace(tmp, path)
+        return path
+
+    @property
+    def sids(self):
+        return sorted(unquote(f[:-len(self.ext)]) for f in os.listdir(self.path) if f.endswith(self.ext))
+
+    def __contains__(self, sid):
+        return os.path.exists(self.file_path(sid))
+
+    def read(self, sid, fields=None, start=None, end=None):
+        fields = isinstance(fields, str) and [fields] or fields
+        frame = self._reader(self.file_path(sid), fields)
+        if start is not None or end is not None:
+            frame = frame.loc[start and pd.to_datetime(start):end and pd.to_datetime(end)]
+        return frame
+
+    def as_map(self, sids=None, fields=None, start=None, end=None):
+        sids = self.sids if sids is None else isinstance(sids, str) and [sids] or sids
+        return {sid: self.read(sid, fields=fields, start=start, end=end) for sid in sids}
+
+    def as_frame(self, sids=None, fields=None, start=None, end=None):
+        """ :return: Multi-Index DataFrame """
+        fmap = self.as_map(sids, fields=fields, start=start, end=end)
+        return pd.concat(fmap.values(), keys=fmap.keys(), axis=1)
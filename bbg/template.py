@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+import blpapi
+
+SECURITIES = blpapi.Name('securities')
+FIELDS = blpapi.Name('fields')
+OVERRIDES = blpapi.Name('overrides')
+FIELD_ID = blpapi.Name('fieldId')
+VALUE = blpapi.Name('value')
+
+
+class RequestTemplate(object):
+    """The invariant part of a //blp/refdata request: operation, fields, settings, flags and overrides.
+
+    A blpapi request can only be sent once, so create still builds a new request per call. Everything else is
+    resolved when the template is built (element names, flag values, override pairs) and the per call work is
+    reduced to appending the securities and setting the call specific values (e.g. the dates).
+
+    Parameters
+    ----------
+    operation: request name, e.g. HistoricalDataRequest
+    fields: bbg field names
+    settings: map of element name to value. Falsy values are not set
+    flags: map of element name to flag. None values are not set, others are set to their boolean value
+    overrides: map of field id to override value
+    """
+
+    def __init__(self, operation, fields, settings=None, flags=None, overrides=None):
+        self.operation = operation
+        self.fields = tuple(fields)
+        self.settings = tuple((blpapi.Name(k), v) for k, v in (settings or {}).items() if v)
+        self.flags = tuple((blpapi.Name(k), bool(v)) for k, v in (flags or {}).items() if v is not None)
+        self.overrides = tuple((overrides or {}).items())
+
+    def __repr__(self):
+        fmtargs = dict(clz=self.__class__.__name__,
+                       operation=self.operation,
+                       fields=','.join(self.fields),
+                       overrides=','.join(['%s=%s' % (k, v) for k, v in self.overrides]))
+        return '<{clz}({operation}, [{fields}], overrides={overrides})'.format(**fmtargs)
+
+    def create(self, svc, securities, **settings):
+        """Create the bloomberg request for the specified securities and call specific settings"""
+        request = svc.createRequest(self.operation)
+        secs = request.getElement(SECURITIES)
+        for sid in securities:
+            secs.appendValue(sid)
+        flds = request.getElement(FIELDS)
+        for fld in self.fields:
+            flds.appendValue(fld)
+        for name, value in self.settings:
+            request.set(name, value)
+        for name, value in self.flags:
+            request.set(name, value)
+        for name, value in settings.items():
+            request.set(name, value)
+        if self.overrides:
+            ovrds = request.getElement(OVERRIDES)
+            for fld, value in self.overrides:
+                o = ovrds.appendElement()
+                o.setElement(FIELD_ID, fld)
+                o.setElement(VALUE, value)
+        return request
+
+
+@lru_cache(maxsize=256)
+def _compile(operation, fields, settings, flags, overrides):
+    return RequestTemplate(operation, fields, dict(settings), dict(flags), dict(overrides))
+
+
+def get_template(operation, fields, settings=None, flags=None, overrides=None):
+    """Return the template for the specified arguments. Templates are shared between requests which use the
+    same operation, fields, settings, flags and overrides so they are only compiled once."""
+    args = (operation, tuple(fields), tuple((settings or {}).items()), tuple((flags or {}).items()),
+            tuple((overrides or {}).items()))
+    try:
+        return _compile(*args)
+    except TypeError:
+        # unhashable override value, compile it for this request only
+        return RequestTemplate(operation, fields, settings, flags, overrides)
@@ -1,8 +1,14 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import blpapi
 import numpy as np
 import pandas as pd
 
 from bbg.eqs import EQSRequest
+from bbg.field_info import FieldInfoCache, FieldInfoRequest
 from bbg.historical_data import HistoricalDataRequest
 from bbg.intraday_bar import IntradayBarRequest
 from bbg.intraday_tick import IntradayTickRequest
@@ -11,14 +17,48 @@ from bbg.reference_data import ReferenceDataRequest
 from bbg.utils import XmlHelper
 
 
+class SessionError(Exception):
+    """Raised when a session cannot be started, a service cannot be opened or the session drops mid-request"""
+    pass
+
+
+class RequestTimeoutError(Exception):
+    """Raised when a request does not complete before its deadline"""
+    pass
+
+
+class RequestCancelledError(Exception):
+    """Raised when a request is cancelled with Request.cancel before it completes"""
+    pass
+
+
 class Terminal(object):
     """Submits requests to the Bloomberg Terminal and dispatches the events back to the request
     object for processing.
+
+    Parameters
+    ----------
+    host: server host
+    port: server port
+    pipelined: If True, one thread only receives the events while parser threads convert them, so the socket
+               keeps being drained while large partial responses are parsed
+    n_parsers: number of parser threads used in pipelined mode
+    max_queued_events: maximum number of received events waiting to be parsed and stored in pipelined mode
+    field_cache: FieldInfoCache used by get_field_info. If None, the default on-disk cache is used
+    timeout: default number of seconds a request may take, see execute. If None, requests have no deadline
+    partial: default behaviour on deadline or cancellation, see execute
     """
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, pipelined=False, n_parsers=1, max_queued_events=32, field_cache=None,
+                 timeout=None, partial=False):
         self.host = host
         self.port = port
+        self.timeout = timeout
+        self.partial = partial
+        self.field_cache = field_cache or FieldInfoCache()
+        self.pipelined = pipelined
+        self.n_parsers = n_parsers
+        self.max_queued_events = max_queued_events
         self.logger = instance_logger(repr(self), self)
 
     def __repr__(self):
@@ -41,68 +81,202 @@ class Terminal(object):
         session.stop()
         return check
 
-    def execute(self, request):
+    @staticmethod
+    def is_session_down(evt):
+        """True if the specified SESSION_STATUS event signals the session can no longer deliver the response"""
+        if evt.eventType() != blpapi.Event.SESSION_STATUS:
+            return False
+        return any(msg.messageType() in ('SessionTerminated', 'SessionStartupFailure') for msg in evt)
+
+    def execute(self, request, timeout=None, partial=None):
+        """Send the request and process its response.
+
+        Parameters
+        ----------
+        request: Request
+        timeout: seconds after which the request is cancelled. If None, the terminal timeout is used
+        partial: If True, a request which is cancelled (see Request.cancel) or reaches its deadline returns the
+                 data received so far and its is_complete flag is False. Otherwise a RequestCancelledError or a
+                 RequestTimeoutError is raised. If None, the terminal partial setting is used
+        """
+        timeout = self.timeout if timeout is None else timeout
+        partial = self.partial if partial is None else partial
+        deadline = timeout is not None and time.time() + timeout or None
         session = self._create_session()
         if not session.start():
-            raise Exception('failed to start session')
+            raise SessionError('failed to start session on %s:%s' % (self.host, self.port))
 
         try:
             self.logger.info('executing request: %s' % repr(request))
             if not session.openService(request.svc_name):
-                raise Exception('failed to open service %s' % request.svc_name)
+                raise SessionError('failed to open service %s' % request.svc_name)
 
             svc = session.getService(request.svc_name)
             asbbg = request.get_bbg_request(svc, session)
             # setup response capture
+            request.is_complete = False
             request.new_response()
-            session.sendRequest(asbbg)
-            while True:
-                evt = session.nextEvent(500)
-                if evt.eventType() == blpapi.Event.RESPONSE:
-                    request.on_event(evt, is_final=True)
-                    break
-                elif evt.eventType() == blpapi.Event.PARTIAL_RESPONSE:
-                    request.on_event(evt, is_final=False)
-                else:
-                    request.on_admin_event(evt)
+            cid = blpapi.CorrelationId()
+            session.sendRequest(asbbg, correlationId=cid)
+            if self.pipelined:
+                stopped = self._receive_pipelined(session, request, deadline)
+            else:
+                stopped = self._receive(session, request, deadline)
+            if stopped:
+                session.cancel(cid)
+                if not partial:
+                    clz = request.is_cancelled and RequestCancelledError or RequestTimeoutError
+                    raise clz('%r %s' % (request, stopped))
+                self.logger.warning('%r %s, returning partial response' % (request, stopped))
+            else:
+                request.is_complete = True
             request.has_exception and request.raise_exception()
             return request.response
         finally:
             session.stop()
 
+    @staticmethod
+    def _stop_reason(request, deadline):
+        if request.is_cancelled:
+            return 'cancelled'
+        if deadline is not None and time.time() >= deadline:
+            return 'timed out'
+
+    @staticmethod
+    def _wait_ms(deadline):
+        """time to wait for the next event, nextEvent(0) would wait forever"""
+        if deadline is None:
+            return 500
+        return int(max(1, min(500, (deadline - time.time()) * 1000)))
+
+    def _on_admin_event(self, request, evt):
+        request.on_admin_event(evt)
+        if self.is_session_down(evt):
+            raise SessionError('session to %s:%s terminated' % (self.host, self.port))
+
+    def _receive(self, session, request, deadline=None):
+        """Receive, parse and store the response events on the calling thread.
+        :return: None once the final response is processed, else the reason the request was stopped"""
+        while True:
+            stopped = self._stop_reason(request, deadline)
+            if stopped:
+                return stopped
+            evt = session.nextEvent(self._wait_ms(deadline))
+            if evt.eventType() == blpapi.Event.RESPONSE:
+                request.on_event(evt, is_final=True)
+                return None
+            elif evt.eventType() == blpapi.Event.PARTIAL_RESPONSE:
+                request.on_event(evt, is_final=False)
+            else:
+                self._on_admin_event(request, evt)
+
+    def _receive_pipelined(self, session, request, deadline=None):
+        """Receive the response events on a dedicated thread and parse them on n_parsers threads. The parsed
+        results are stored by the calling thread in the order the events were received, so the response is
+        identical to the one built by _receive.
+        :return: None once the final response is processed, else the reason the request was stopped"""
+        pending = queue.Queue(self.max_queued_events)
+        stop = threading.Event()
+        parsers = ThreadPoolExecutor(self.n_parsers)
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=.5)
+                    return
+                except queue.Full:
+                    pass
+
+        def receive():
+            try:
+                while not stop.is_set():
+                    evt = session.nextEvent(500)
+                    etype = evt.eventType()
+                    if etype in (blpapi.Event.RESPONSE, blpapi.Event.PARTIAL_RESPONSE):
+                        is_final = etype == blpapi.Event.RESPONSE
+                        put((evt, is_final, parsers.submit(request.parse_event, evt, is_final)))
+                        if is_final:
+                            break
+                    else:
+                        put((evt, None, None))
+            except Exception as e:
+                put((None, None, e))
+
+        receiver = threading.Thread(target=receive, name='%r-receiver' % self, daemon=True)
+        receiver.start()
+        try:
+            while True:
+                stopped = self._stop_reason(request, deadline)
+                if stopped:
+                    return stopped
+                try:
+                    evt, is_final, parsed = pending.get(timeout=self._wait_ms(deadline) / 1000.)
+                except queue.Empty:
+                    continue
+                if evt is None:
+                    raise parsed
+                elif parsed is None:
+                    self._on_admin_event(request, evt)
+                else:
+                    request.on_parsed(parsed.result(), is_final)
+                    if is_final:
+                        return None
+        finally:
+            stop.set()
+            receiver.join()
+            parsers.shutdown(wait=True)
+
+    def get_field_info(self, flds, refresh=False):
+        """Return a map of the specified field names to their FieldInfo. Fields missing from the field cache
+        (or all of them if refresh) are looked up with the //blp/apiflds service and cached. Unknown fields are
+        omitted."""
+        flds = isinstance(flds, str) and [flds] or list(flds)
+        missing = refresh and flds or self.field_cache.missing(flds)
+        if missing:
+            req = FieldInfoRequest(missing, ignore_field_error=1)
+            self.field_cache.update(self.execute(req).as_map().values())
+            req.field_errors and self.logger.warning('unknown fields: %s' % [e.field for e in req.field_errors])
+        return self.field_cache.get(flds)
+
     def get_historical(self, sids, flds, start=None, end=None, period=None, ignore_security_error=0,
-                       ignore_field_error=0, **overrides):
+                       ignore_field_error=0, typed=False, sink=None, **overrides):
         req = HistoricalDataRequest(sids, flds, start=start, end=end, period=period,
                                     ignore_security_error=ignore_security_error,
                                     ignore_field_error=ignore_field_error,
+                                    field_info=typed and self.get_field_info(flds) or None, sink=sink,
                                     **overrides)
         return self.execute(req)
 
-    def get_reference_data(self, sids, flds, ignore_security_error=0, ignore_field_error=0, **overrides):
+    def get_reference_data(self, sids, flds, ignore_security_error=0, ignore_field_error=0, typed=False,
+                           **overrides):
         req = ReferenceDataRequest(sids, flds, ignore_security_error=ignore_security_error,
-                                   ignore_field_error=ignore_field_error, **overrides)
+                                   ignore_field_error=ignore_field_error,
+                                   field_info=typed and self.get_field_info(flds) or None, **overrides)
         return self.execute(req)
 
     def get_intraday_tick(self, sid, events='TRADE', start=None, end=None, include_condition_codes=None,
                           include_nonplottable_events=None, include_exchange_codes=None, return_eids=None,
-                          include_broker_codes=None, include_rsp_codes=None, include_bic_mic_codes=None):
+                          include_broker_codes=None, include_rsp_codes=None, include_bic_mic_codes=None,
+                          compact=False, float32_prices=False, int32_sizes=False):
         req = IntradayTickRequest(sid, start=start, end=end, events=events,
                                   include_condition_codes=include_condition_codes,
                                   include_non_plottable_events=include_nonplottable_events,
                                   include_exchange_codes=include_exchange_codes,
                                   return_eids=return_eids, include_broker_codes=include_broker_codes,
                                   include_rsp_codes=include_rsp_codes,
-                                  include_bic_mic_codes=include_bic_mic_codes)
+                                  include_bic_mic_codes=include_bic_mic_codes, compact=compact,
+                                  float32_prices=float32_prices, int32_sizes=int32_sizes)
         return self.execute(req)
 
     def get_intraday_bar(self, sid, event='TRADE', start=None, end=None, interval=None, gap_fill_initial_bar=None,
                          return_eids=None, adjustment_normal=None, adjustment_abnormal=None, adjustment_split=None,
-                         adjustment_follow_dpdf=None):
+                         adjustment_follow_dpdf=None, compact=False, float32_prices=False, int32_sizes=False):
         req = IntradayBarRequest(sid, start=start, end=end, event=event, interval=interval,
                                  gap_fill_initial_bar=gap_fill_initial_bar,
                                  return_eids=return_eids, adjustment_normal=adjustment_normal,
                                  adjustment_split=adjustment_split,
-                                 adjustment_abnormal=adjustment_abnormal, adjustment_follow_dpdf=adjustment_follow_dpdf)
+                                 adjustment_abnormal=adjustment_abnormal, adjustment_follow_dpdf=adjustment_follow_dpdf,
+                                 compact=compact, float32_prices=float32_prices, int32_sizes=int32_sizes)
         return self.execute(req)
 
     def get_screener(self, name, group='General', type_='GLOBAL', asof=None, language=None):
@@ -110,6 +284,152 @@ class Terminal(object):
         return self.execute(req)
 
 
+class Endpoint(object):
+    """Book-keeping for a single host:port served by a MultiTerminal"""
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.outstanding = 0
+        self.failures = 0
+        self.retry_at = 0.
+
+    def __repr__(self):
+        return '%s:%s' % (self.terminal.host, self.terminal.port)
+
+    def is_available(self, now):
+        return self.retry_at <= now
+
+    def on_success(self):
+        self.failures = 0
+        self.retry_at = 0.
+
+    def on_failure(self, now, backoff, max_backoff):
+        self.failures += 1
+        self.retry_at = now + min(max_backoff, backoff * 2 ** (self.failures - 1))
+
+
+class MultiTerminal(Terminal):
+    """Spreads requests across several Bloomberg endpoints (e.g. SAPI / B-PIPE gateways).
+
+    Requests are sent to the endpoint with the fewest outstanding requests (or in round-robin order). An endpoint
+    whose session fails is taken out of rotation with an exponential backoff, probed with check_session once the
+    backoff expires and put back on success. All the requests issued by this package only read data, so a request
+    which fails with a SessionError is transparently retried on another endpoint.
+
+    Parameters
+    ----------
+    endpoints: list of (host, port) tuples or 'host:port' strings
+    strategy: (least_outstanding | round_robin)
+    max_attempts: maximum number of endpoints tried per request. If None, every endpoint is tried once
+    backoff: seconds an endpoint is out of rotation after its first failure, doubled on each further failure
+    max_backoff: upper bound of the backoff in seconds
+    terminal_options: passed to the Terminal of each endpoint, e.g. pipelined=True
+    """
+
+    def __init__(self, endpoints, strategy='least_outstanding', max_attempts=None, backoff=1., max_backoff=60.,
+                 **terminal_options):
+        assert strategy in ('least_outstanding', 'round_robin')
+        terminal_options.setdefault('field_cache', FieldInfoCache())
+        self.endpoints = []
+        for ep in endpoints:
+            host, port = isinstance(ep, str) and ep.rsplit(':', 1) or ep
+            self.endpoints.append(Endpoint(Terminal(host, int(port), **terminal_options)))
+        assert self.endpoints, 'at least one endpoint is required'
+        self.strategy = strategy
+        self.max_attempts = max_attempts or len(self.endpoints)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._rr_index = 0
+        Terminal.__init__(self, None, None, **terminal_options)
+
+    def __repr__(self):
+        fmtargs = dict(clz=self.__class__.__name__, endpoints=','.join(repr(ep) for ep in self.endpoints))
+        return '<{clz}({endpoints})'.format(**fmtargs)
+
+    def _create_session(self):
+        raise NotImplementedError('sessions are created by the endpoint terminals')
+
+    def _probe(self, endpoint):
+        """Health-check an endpoint coming out of backoff, return True if it can be used"""
+        try:
+            ok = endpoint.terminal.check_session()
+        except Exception:
+            ok = False
+        with self._lock:
+            if ok:
+                endpoint.on_success()
+            else:
+                endpoint.on_failure(time.time(), self.backoff, self.max_backoff)
+        ok or self.logger.warning('endpoint %r failed health check' % endpoint)
+        return ok
+
+    def _select(self, exclude):
+        """Return the next endpoint to use (its outstanding count already incremented) or None"""
+        with self._lock:
+            now = time.time()
+            n = len(self.endpoints)
+            ordered = [self.endpoints[(self._rr_index + i) % n] for i in range(n)]
+            candidates = [ep for ep in ordered if ep not in exclude and ep.is_available(now)]
+            if not candidates:
+                return None
+            if self.strategy == 'least_outstanding':
+                # min keeps the first of equals, so ties are broken in round-robin order
+                endpoint = min(candidates, key=lambda ep: ep.outstanding)
+            else:
+                endpoint = candidates[0]
+            self._rr_index = (self.endpoints.index(endpoint) + 1) % n
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint, error=None):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.on_success()
+            else:
+                endpoint.on_failure(time.time(), self.backoff, self.max_backoff)
+
+    def check_endpoints(self):
+        """Health-check every endpoint and return a map of endpoint to check result"""
+        return {repr(ep): self._probe(ep) for ep in self.endpoints}
+
+    def check_session(self):
+        return any(self.check_endpoints().values())
+
+    def execute(self, request, timeout=None, partial=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = timeout is not None and time.time() + timeout or None
+        tried = []
+        errors = []
+        while len(tried) < self.max_attempts:
+            endpoint = self._select(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            if endpoint.failures and not self._probe(endpoint):
+                with self._lock:
+                    endpoint.outstanding -= 1
+                continue
+            try:
+                # the deadline covers all the attempts
+                remaining = deadline and max(0., deadline - time.time())
+                response = endpoint.terminal.execute(request, timeout=remaining, partial=partial)
+            except SessionError as e:
+                self._release(endpoint, e)
+                errors.append('%r: %s' % (endpoint, e))
+                self.logger.warning('request failed on %r, %s' % (endpoint, e))
+                request.clear_errors()
+                continue
+            except Exception:
+                # request level failures (security / field errors, response errors) would fail on any endpoint
+                self._release(endpoint)
+                raise
+            self._release(endpoint)
+            return response
+        raise SessionError('no endpoint could serve %r: %s' % (request, '; '.join(errors) or 'none available'))
+
+
 class SyncSubscription(object):
 
     def __init__(self, tickers, fields, interval=None, host='localhost', port=8194):
@@ -124,12 +444,15 @@ class SyncSubscription(object):
         vals = np.repeat(np.nan, n_rows * n_cols).reshape((n_rows, n_cols))
         self.frame = pd.DataFrame(vals, columns=self.fields, index=self.tickers)
 
-    def _init(self):
-        # init session
+    def _create_session(self):
         opts = blpapi.SessionOptions()
         opts.setServerHost(self.host)
         opts.setServerPort(self.port)
-        self.session = session = blpapi.Session(opts)
+        return blpapi.Session(opts)
+
+    def _init(self):
+        # init session
+        self.session = session = self._create_session()
         if not session.start():
             raise Exception('failed to start session')
 
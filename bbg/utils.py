@@ -182,6 +182,23 @@ class XmlHelper(object):
             return None
 
 
+def datetime_to_ns(times):
+    """:return: (int64 nanoseconds since epoch in UTC, tz) of the specified datetime-like values"""
+    times = pd.DatetimeIndex(times)
+    tz = times.tz
+    if tz is not None:
+        times = times.tz_convert(None)
+    return np.asarray(times, dtype='datetime64[ns]').view('i8'), tz
+
+
+def ns_to_datetime(ns, tz=None):
+    """inverse of datetime_to_ns"""
+    times = pd.DatetimeIndex(np.asarray(ns, dtype='i8').view('datetime64[ns]'))
+    if tz is None:
+        return times
+    return times.tz_localize('UTC').tz_convert(tz)
+
+
 def debug_event(evt):
     print('unhandled event: %s' % evt.EventType)
     if evt.EventType in [blpapi.Event.RESPONSE, blpapi.Event.PARTIAL_RESPONSE]:
@@ -0,0 +1,91 @@
+"""
+Benchmark of the construction overhead of //blp/refdata requests, built element by element as the requests used
+to do, against the compiled request templates.
+
+Needs a session to get the service schema, or --simulated to build the simulator's stand-in requests. Run from
+the repository root:
+
+    python -m benchmarks.bbg_request_construction --host localhost --port 8194
+
+Author: Antonio Ventilii
+"""
+
+import argparse
+import timeit
+
+from bbg.historical_data import HistoricalDataRequest
+from bbg.reference_data import ReferenceDataRequest
+from bbg.simulator import SimulatedTerminal
+from bbg.terminal import Terminal
+
+FIELDS = ['PX_OPEN', 'PX_HIGH', 'PX_LOW', 'PX_LAST', 'PX_VOLUME', 'EQY_WEIGHTED_AVG_PX', 'CUR_MKT_CAP']
+OVERRIDES = {'EQY_FUND_CRNCY': 'USD', 'BEST_FPERIOD_OVERRIDE': '1BF', 'SETTLE_DT': '20240102'}
+
+
+def build_historical_naive(svc, sids, req):
+    """Build the request element by element, resolving every name and the overrides element on each call"""
+    request = svc.createRequest('HistoricalDataRequest')
+    [request.append('securities', sec) for sec in sids]
+    [request.append('fields', fld) for fld in req.fields]
+    request.set('startDate', req.start.strftime('%Y%m%d'))
+    request.set('endDate', req.end.strftime('%Y%m%d'))
+    request.set('periodicitySelection', req.period)
+    req.currency and request.set('currency', req.currency)
+    req.set_flag(request, req.adjustment_split, 'adjustmentSplit')
+    for k, v in req.overrides.items():
+        o = request.getElement('overrides').appendElement()
+        o.setElement('fieldId', k)
+        o.setElement('value', v)
+    return request
+
+
+def build_reference_naive(svc, sids, req):
+    request = svc.createRequest('ReferenceDataRequest')
+    [request.append('securities', sec) for sec in sids]
+    [request.append('fields', fld) for fld in req.fields]
+    req.set_flag(request, req.return_formatted_value, 'returnFormattedValue')
+    for k, v in req.overrides.items():
+        o = request.getElement('overrides').appendElement()
+        o.setElement('fieldId', k)
+        o.setElement('value', v)
+    return request
+
+
+def report(name, naive, template, number):
+    t_naive = min(timeit.repeat(naive, number=number, repeat=5)) / number * 1e6
+    t_template = min(timeit.repeat(template, number=number, repeat=5)) / number * 1e6
+    print('%-24s naive: %8.1f us   template: %8.1f us   speedup: %.2fx' % (name, t_naive, t_template,
+                                                                           t_naive / t_template))
+
+
+def main(host, port, n_sids, number, simulated=False):
+    terminal = simulated and SimulatedTerminal() or Terminal(host, port)
+    session = terminal._create_session()
+    if not session.start() or not session.openService('//blp/refdata'):
+        raise Exception('failed to start session on %s:%s' % (host, port))
+    try:
+        svc = session.getService('//blp/refdata')
+        sids = ['SID%04d US Equity' % i for i in range(n_sids)]
+
+        hreq = HistoricalDataRequest(sids, FIELDS, currency='USD', adjustment_split=True, **OVERRIDES)
+        report('HistoricalDataRequest', lambda: build_historical_naive(svc, sids, hreq),
+               lambda: HistoricalDataRequest(sids, FIELDS, currency='USD', adjustment_split=True,
+                                             **OVERRIDES).get_bbg_request(svc, session), number)
+
+        rreq = ReferenceDataRequest(sids, FIELDS, return_formatted_value=True, **OVERRIDES)
+        report('ReferenceDataRequest', lambda: build_reference_naive(svc, sids, rreq),
+               lambda: ReferenceDataRequest(sids, FIELDS, return_formatted_value=True,
+                                            **OVERRIDES).get_bbg_request(svc, session), number)
+    finally:
+        session.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8194)
+    parser.add_argument('--sids', type=int, default=10, help='securities per request')
+    parser.add_argument('--number', type=int, default=2000, help='requests built per timing')
+    parser.add_argument('--simulated', action='store_true', help='use the simulator instead of a session')
+    args = parser.parse_args()
+    main(args.host, args.port, args.sids, args.number, args.simulated)
@@ -0,0 +1,57 @@
+"""
+End-to-end load test of the bbg client against the synthetic Bloomberg simulator: throughput and peak python
+memory of historical, reference and intraday tick pulls, sequential vs pipelined and compact.
+
+Run from the repository root:
+
+    python -m benchmarks.bbg_simulated_load --ticks-per-sec 20 --sids 500
+
+Author: Antonio Ventilii
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from bbg.simulator import SimulatedTerminal, SimulatorConfig
+
+
+def measure(name, fetch, count_rows):
+    tracemalloc.start()
+    t0 = time.time()
+    response = fetch()
+    elapsed = time.time() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = count_rows(response)
+    print('%-36s rows: %9d   %7.2fs   %10.0f rows/s   peak: %8.1f MB'
+          % (name, rows, elapsed, rows / elapsed, peak / 2. ** 20))
+
+
+def main(n_sids, ticks_per_sec, latency, message_rate):
+    config = SimulatorConfig(latency=latency, message_rate=message_rate, tick_rate=ticks_per_sec, seed=0)
+    sids = ['SIM%04d US Equity' % i for i in range(n_sids)]
+    fields = ['PX_OPEN', 'PX_HIGH', 'PX_LOW', 'PX_LAST', 'PX_VOLUME']
+    for label, options in [('sequential', {}), ('pipelined', dict(pipelined=True, n_parsers=2))]:
+        terminal = SimulatedTerminal(config, **options)
+        measure('historical %s' % label,
+                lambda: terminal.get_historical(sids, fields, start='2020-01-01', end='2023-12-31'),
+                lambda r: sum(len(f) for f in r.as_map().values()))
+        measure('reference %s' % label, lambda: terminal.get_reference_data(sids, fields),
+                lambda r: len(r.as_map()))
+        for compact in (False, True):
+            measure('intraday tick %s%s' % (label, compact and ' compact' or ''),
+                    lambda: terminal.get_intraday_tick(sids[0], ['TRADE', 'BID', 'ASK'], start='2024-01-02 09:30',
+                                                       end='2024-01-02 16:00', include_condition_codes=True,
+                                                       compact=compact),
+                    lambda r: len(r.as_frame()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sids', type=int, default=200, help='securities per historical / reference request')
+    parser.add_argument('--ticks-per-sec', type=float, default=10., help='simulated ticks per second')
+    parser.add_argument('--latency', type=float, default=0., help='seconds before the first response event')
+    parser.add_argument('--message-rate', type=float, default=None, help='maximum response messages per second')
+    args = parser.parse_args()
+    main(args.sids, args.ticks_per_sec, args.latency, args.message_rate)
@@ -0,0 +1,110 @@
+"""
+Benchmark of the page-load time saved by the performance mode of the firefox() and chrome() drivers, on a local
+set of data pages that also pull images, web fonts, media and third-party scripts served with added latency.
+
+Run as a script, since the repository's email.py would shadow the standard library when run with -m from the
+repository root:
+
+    python benchmarks/webdriver_page_load.py --browser firefox --pages 10 --latency 0.05
+
+Author: Antonio Ventilii
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # after the standard library
+
+import webdriver  # noqa: E402
+
+ASSETS = {
+    'img': ('image/png', 200_000, 12),
+    'font': ('font/woff2', 100_000, 3),
+    'media': ('video/mp4', 2_000_000, 1),
+    'tracker': ('application/javascript', 50_000, 4),
+}
+
+
+def page(n: int, rows: int = 500) -> bytes:
+    """
+    Returns a data page: a table of rows with the images, fonts, media and scripts of a typical site around it.
+    """
+    imgs = ''.join(f'<img src="/img/{n}-{i}.png">' for i in range(ASSETS['img'][2]))
+    fonts = ''.join(f'@font-face {{ font-family: f{i}; src: url(/font/{n}-{i}.woff2); }} '
+                    f'.f{i} {{ font-family: f{i}; }}' for i in range(ASSETS['font'][2]))
+    scripts = ''.join(f'<script src="/tracker/{n}-{i}.js"></script>' for i in range(ASSETS['tracker'][2]))
+    table = ''.join(f'<tr><td>{r}</td><td class="f{r % 3}">{r * 1.5:.2f}</td></tr>' for r in range(rows))
+    return (f'<html><head><style>{fonts}</style>{scripts}</head><body>{imgs}'
+            f'<video autoplay src="/media/{n}.mp4"></video>'
+            f'<table id="data">{table}</table></body></html>').encode()
+
+
+def serve(latency: float) -> str:
+    """
+    Starts the page server on a free local port and returns its base URL.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            kind = self.path.split('/')[1]
+            if kind in ASSETS:
+                time.sleep(latency)
+                content_type, size, _ = ASSETS[kind]
+                body = b'\0' * size
+            else:
+                content_type, body = 'text/html', page(int(self.path.strip('/').split('.')[0] or 0))
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def measure(factory, url: str, n_pages: int, performance: bool) -> list[float]:
+    driver = factory(headless=True, performance=performance, blocked_urls=['*/tracker/*'] if performance else None)
+    try:
+        driver.get(f'{url}/0.html')  # warm up
+        times = []
+        for n in range(n_pages):
+            t0 = time.perf_counter()
+            driver.get(f'{url}/{n}.html')
+            driver.find_element('id', 'data')
+            times.append(time.perf_counter() - t0)
+        return times
+    finally:
+        driver.quit()
+
+
+def main(browsers: list[str], n_pages: int, latency: float):
+    url = serve(latency)
+    for browser in browsers:
+        factory = getattr(webdriver, browser)
+        default = measure(factory, url, n_pages, False)
+        fast = measure(factory, url, n_pages, True)
+        saved = 1 - statistics.median(fast) / statistics.median(default)
+        print(f'{browser:8s} default: {statistics.median(default) * 1e3:8.1f} ms   '
+              f'performance: {statistics.median(fast) * 1e3:8.1f} ms   saved: {saved:6.1%}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--browser', action='append', choices=['firefox', 'chrome'],
+                        help='browser to benchmark, repeatable (default: firefox)')
+    parser.add_argument('--pages', type=int, default=10, help='pages loaded per mode')
+    parser.add_argument('--latency', type=float, default=.05, help='seconds of latency added to every asset')
+    args = parser.parse_args()
+    main(args.browser or ['firefox'], args.pages, args.latency)
@@ -1,18 +1,404 @@
 # -*- coding: utf-8 -*-
 """
 Provides functions for creating and displaying email messages and meeting invitations.
-This module uses the win32com library to interact with Microsoft Outlook.
+Emails go through a pluggable backend: Microsoft Outlook automation with the win32com library (the default, and
+the only one for meeting invitations), or SMTP for batch servers. HTML templates get their CSS inlined once and
+cached, so rendering them for each recipient only substitutes the data.
 
 Author: Antonio Ventilii
 """
 
-import pythoncom
-import win32com.client as win32
+import html
+import mimetypes
+import os
+import queue
+import smtplib
+import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import Iterable
+
 from premailer import transform
 
+# Maximum total size, in characters of source and inlined HTML, of the templates kept with their CSS inlined
+TEMPLATE_CACHE_CHARS = 4 * 1024 * 1024
+
+_outlook_local = threading.local()
+
+
+def inline_css(html_body: str) -> str:
+    """
+    Returns the HTML with its CSS inlined by premailer, pseudo-classes included.
+
+    Args:
+        html_body (str): The HTML.
+
+    Returns:
+        str: The HTML with inline styles.
+    """
+    return transform(html_body, exclude_pseudoclasses=False)
+
+
+class EmailTemplate:
+    """
+    HTML email template with $name placeholders (string.Template syntax) whose CSS is inlined once, rendering
+    only substituting the data into the inlined HTML.
+    """
+
+    def __init__(self, html_body: str):
+        """
+        Args:
+            html_body (str): The HTML template, with its stylesheets.
+        """
+        self.html_body = html_body
+        self.inlined = string.Template(inline_css(html_body))
+
+    def __repr__(self) -> str:
+        return f'<EmailTemplate(placeholders={self.placeholders})>'
+
+    def __len__(self) -> int:
+        return len(self.html_body) + len(self.inlined.template)
+
+    @property
+    def placeholders(self) -> list[str]:
+        names = []
+        for match in self.inlined.pattern.finditer(self.inlined.template):
+            name = match.group('named') or match.group('braced')
+            if name is not None and name not in names:
+                names.append(name)
+        return names
+
+    def render(self, data: dict = None, safe: Iterable[str] = (), **kwargs) -> str:
+        """
+        Returns the inlined HTML with the data substituted, HTML-escaped unless their key is in safe.
+
+        Args:
+            data (dict, optional): The placeholder values. Defaults to None.
+            safe (Iterable[str], optional): Placeholders whose values are HTML and not escaped. Defaults to ().
+            **kwargs: Additional placeholder values.
+
+        Returns:
+            str: The rendered HTML.
+
+        Raises:
+            KeyError: If a placeholder has no value.
+        """
+        safe = set(safe)
+        data = dict(data or {}, **kwargs)
+        return self.inlined.substitute({k: v if k in safe else html.escape(str(v)) for k, v in data.items()})
+
+
+class TemplateCache:
+    """
+    LRU cache of the EmailTemplates by source HTML, evicting the least recently used ones once their total size
+    exceeds max_chars. A template larger than max_chars is returned without being kept.
+    """
+
+    def __init__(self, max_chars: int = TEMPLATE_CACHE_CHARS):
+        """
+        Args:
+            max_chars (int, optional): Maximum total size of the templates. Defaults to TEMPLATE_CACHE_CHARS.
+        """
+        self.max_chars = max_chars
+        self.chars = 0
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'<TemplateCache(templates={len(self._templates)}, chars={self.chars}, max_chars={self.max_chars})>'
+
+    def get(self, html_body: str) -> EmailTemplate:
+        """
+        Returns the EmailTemplate of the HTML, inlining its CSS on a miss.
+        """
+        with self._lock:
+            template = self._templates.get(html_body)
+            if template is not None:
+                self._templates.move_to_end(html_body)
+                return template
+        template = EmailTemplate(html_body)  # outside the lock, premailer is slow
+        if len(template) > self.max_chars:
+            return template
+        with self._lock:
+            if html_body not in self._templates:
+                self._templates[html_body] = template
+                self.chars += len(template)
+            self._templates.move_to_end(html_body)
+            while self.chars > self.max_chars:
+                self.chars -= len(self._templates.popitem(last=False)[1])
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+            self.chars = 0
+
+
+_template_cache = TemplateCache()
+
+
+def email_template(html_body: str) -> EmailTemplate:
+    """
+    Returns the cached EmailTemplate of the HTML.
+    """
+    return _template_cache.get(html_body)
+
+
+def render_email(html_body: str, data: dict = None, safe: Iterable[str] = (), **kwargs) -> str:
+    """
+    Renders an HTML template for one recipient, the template's CSS being inlined on the first call only.
+
+    Args:
+        html_body (str): The HTML template, with $name placeholders.
+        data (dict, optional): The placeholder values. Defaults to None.
+        safe (Iterable[str], optional): Placeholders whose values are HTML and not escaped. Defaults to ().
+        **kwargs: Additional placeholder values.
+
+    Returns:
+        str: The rendered HTML with inline styles.
+    """
+    return email_template(html_body).render(data, safe=safe, **kwargs)
+
+
+def _outlook_application():
+    """
+    Returns the Outlook application of the calling thread, initializing COM only once per thread.
+    """
+    application = getattr(_outlook_local, 'application', None)
+    if application is None:
+        import pythoncom
+        import win32com.client as win32
+
+        pythoncom.CoInitialize()
+        application = win32.Dispatch('outlook.application')
+        _outlook_local.application = application
+    return application
+
+
+class EmailBackend:
+    """
+    Base class of the backends creating and sending the emails of create_email.
+    """
+
+    def create_email(self, html_body: str, subject: str = None, recipient: str = None, copy_recipient: str = None,
+                     attachments: list[str] = None, auto_send: bool = False):
+        raise NotImplementedError
+
+
+class OutlookBackend(EmailBackend):
+    """
+    Creates the emails in Microsoft Outlook, displaying them or sending them right away.
+    """
+
+    def create_email(self, html_body: str, subject: str = None, recipient: str = None, copy_recipient: str = None,
+                     attachments: list[str] = None, auto_send: bool = False):
+        """
+        Creates an Outlook email, sent when auto_send and a recipient are given, displayed otherwise.
+
+        Returns:
+            The Outlook MailItem.
+        """
+        mail = _outlook_application().CreateItem(0)
+        mail.To = recipient or ''
+        mail.CC = copy_recipient or ''
+        mail.Subject = subject or ''
+        mail.HTMLBody = html_body
+
+        for attachment in attachments or []:
+            mail.Attachments.Add(attachment)
+
+        if auto_send and recipient is not None and recipient != '':
+            mail.Send()
+        else:
+            mail.Display()
+        return mail
+
+
+class SmtpBackend(EmailBackend):
+    """
+    Sends the emails over SMTP, keeping up to max_connections authenticated connections open and reusing them.
+
+    Messages failing with a temporary error (dropped connection, 4xx reply) are retried with backoff, and
+    right away when an idle connection turned out to be stale.
+    """
+
+    def __init__(self, host: str, port: int = 587, username: str = None, password: str = None, sender: str = None,
+                 starttls: bool = True, use_ssl: bool = False, timeout: float = 30., max_connections: int = 4,
+                 retries: int = 2, backoff: float = 1.):
+        """
+        Args:
+            host (str): The SMTP server host.
+            port (int, optional): The SMTP server port. Defaults to 587.
+            username (str, optional): The login user, no login if None. Defaults to None.
+            password (str, optional): The login password. Defaults to None.
+            sender (str, optional): The From address. Defaults to username.
+            starttls (bool, optional): Whether to upgrade the connection with STARTTLS. Defaults to True.
+            use_ssl (bool, optional): Whether to connect over SSL, e.g. on port 465. Defaults to False.
+            timeout (float, optional): Socket timeout in seconds. Defaults to 30.
+            max_connections (int, optional): Maximum number of connections open at once. Defaults to 4.
+            retries (int, optional): Number of times a message is retried after a temporary error. Defaults to 2.
+            backoff (float, optional): Seconds before the first retry, doubled after each. Defaults to 1.
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def __repr__(self) -> str:
+        return f'<SmtpBackend(host={self.host}, port={self.port}, max_connections={self.max_connections})>'
+
+    def __enter__(self) -> 'SmtpBackend':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls and not self.use_ssl:
+                connection.starttls()
+            if self.username is not None:
+                connection.login(self.username, self.password)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    @staticmethod
+    def _quit(connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def close(self) -> None:
+        """
+        Closes the idle connections.
+        """
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def create_message(self, html_body: str, subject: str = None, recipient: str = None,
+                       copy_recipient: str = None, attachments: list[str] = None) -> EmailMessage:
+        """
+        Returns the email as a MIME message, with a plain text alternative and the attached files.
+        """
+        message = EmailMessage()
+        message['From'] = self.sender or ''
+        message['To'] = recipient or ''
+        if copy_recipient:
+            message['Cc'] = copy_recipient
+        message['Subject'] = subject or ''
+        message.set_content('This email is in HTML format.')
+        message.add_alternative(html_body, subtype='html')
+        for attachment in attachments or []:
+            content_type = mimetypes.guess_type(attachment)[0] or 'application/octet-stream'
+            maintype, subtype = content_type.split('/', 1)
+            with open(attachment, 'rb') as f:
+                message.add_attachment(f.read(), maintype=maintype, subtype=subtype,
+                                       filename=os.path.basename(attachment))
+        return message
+
+    def create_email(self, html_body: str, subject: str = None, recipient: str = None, copy_recipient: str = None,
+                     attachments: list[str] = None, auto_send: bool = False) -> EmailMessage:
+        """
+        Creates the email, sending it when auto_send and a recipient are given.
+
+        Returns:
+            EmailMessage: The message.
+        """
+        message = self.create_message(html_body, subject=subject, recipient=recipient,
+                                      copy_recipient=copy_recipient, attachments=attachments)
+        if auto_send and recipient is not None and recipient != '':
+            self.send(message)
+        return message
+
+    def send(self, message: EmailMessage) -> None:
+        """
+        Sends a message over one of the open connections, opening one when none is idle.
+
+        Args:
+            message (EmailMessage): The message.
+
+        Raises:
+            smtplib.SMTPException: If the message is refused, or still fails after the retries.
+        """
+        with self._slots:
+            attempt = 0
+            while True:
+                try:
+                    connection, reused = self._idle.get_nowait(), True
+                except queue.Empty:
+                    connection, reused = None, False
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    connection.send_message(message)
+                except OSError as e:  # smtplib.SMTPException included
+                    error = e
+                    if isinstance(e, smtplib.SMTPException) and not isinstance(e, smtplib.SMTPServerDisconnected):
+                        if connection is not None:
+                            self._idle.put(connection)  # the session is still usable after a refused message
+                        temporary = isinstance(e, smtplib.SMTPResponseException) and 400 <= e.smtp_code < 500
+                    else:
+                        if connection is not None:
+                            self._quit(connection)
+                        if reused:
+                            continue  # the idle connection went stale, retry right away over another one
+                        temporary = True
+                else:
+                    self._idle.put(connection)
+                    return
+                if not temporary or attempt >= self.retries:
+                    raise error
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    def send_many(self, messages: Iterable[EmailMessage]) -> list[Exception | None]:
+        """
+        Sends a batch of messages concurrently over up to max_connections connections.
+
+        Args:
+            messages (Iterable[EmailMessage]): The messages.
+
+        Returns:
+            list[Exception | None]: For each message, the error that prevented sending it, or None once sent.
+        """
+
+        def send(message):
+            try:
+                self.send(message)
+            except Exception as e:
+                return e
+            return None
+
+        messages = list(messages)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_connections, len(messages)))) as executor:
+            return list(executor.map(send, messages))
+
 
 def create_email(html_body, subject: str = None, recipient: str = None, copy_recipient: str = None,
-                 attachments: list[str] = None, auto_send: bool = False, transform_body: bool = False):
+                 attachments: list[str] = None, auto_send: bool = False, transform_body: bool = False,
+                 backend: EmailBackend = None):
     """
     Creates and displays an email message.
 
@@ -24,30 +410,21 @@ def create_email(html_body, subject: str = None, recipient: str = None, copy_rec
         attachments (list[str], optional): A list of file paths for attachments. Defaults to None.
         auto_send (bool, optional): Determines whether the email should be sent automatically. Defaults to False.
         transform_body (bool, optional): Determines whether the HTML body should be transformed using premailer.
-                                         Defaults to False.
-    """
-    if attachments is None:
-        attachments = []
-
-    outlook = win32.Dispatch('outlook.application', pythoncom.CoInitialize())
-    mail = outlook.CreateItem(0)
-    mail.To = recipient or ''
-    mail.CC = copy_recipient or ''
-    mail.Subject = subject or ''
+                                         Defaults to False. The body is transformed on every call: render the
+                                         templates sent to many recipients with render_email instead.
+        backend (EmailBackend, optional): The backend creating the email. With SmtpBackend nothing is displayed:
+                                          the message is returned, and sent when auto_send. Defaults to Outlook.
 
+    Returns:
+        The email created by the backend: an Outlook MailItem or an EmailMessage.
+    """
     if transform_body:
         # Transform the HTML body using premailer for pseudo-classes
-        html_body = transform(html_body, exclude_pseudoclasses=False)
-
-    mail.HTMLBody = html_body
+        html_body = inline_css(html_body)
 
-    for attachment in attachments:
-        mail.Attachments.Add(attachment)
-
-    if auto_send and recipient is not None and recipient != '':
-        mail.Send()
-    else:
-        mail.Display()
+    backend = backend or OutlookBackend()
+    return backend.create_email(html_body, subject=subject, recipient=recipient, copy_recipient=copy_recipient,
+                                attachments=attachments, auto_send=auto_send)
 
 
 def create_meeting(subject: str = None, recipient: str = None, start=None, end=None, all_day: bool = False,
@@ -64,8 +441,7 @@ def create_meeting(subject: str = None, recipient: str = None, start=None, end=N
         auto_send (bool, optional): Determines whether the meeting invitation should be sent automatically.
                                     Defaults to False.
     """
-    outlook = win32.Dispatch('outlook.application', pythoncom.CoInitialize())
-    appt = outlook.CreateItem(1)  # AppointmentItem
+    appt = _outlook_application().CreateItem(1)  # AppointmentItem
     appt.Start = start  # yyyy-MM-dd hh:mm
 
     if end:
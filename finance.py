@@ -4,13 +4,44 @@ Provides utility functions related to finance.
 Author: Antonio Ventilii
 """
 
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Iterable, NamedTuple
+
+import numpy as np
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
 user_agent_headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
                   'Chrome/91.0.4472.124 Safari/537.36'
 }
 
+# Chart endpoint the FX functions query; point it at a local stand-in to run them offline
+chart_url = 'https://query1.finance.yahoo.com/v8/finance/chart/'
+
+# Currencies quoted under another code
+currency_mapper = {
+    'cnh': 'cny'
+}
+
+# Seconds a fetched FX rate is served from the cache
+fx_cache_ttl = 60.
+
+DEFAULT_FX_HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'fx_history')
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_fx_cache = {}
+_fx_cache_lock = threading.Lock()
+
 
 def cross(c1: str, c2: str, sep: str = '') -> str:
     """
@@ -45,13 +76,96 @@ def cross(c1: str, c2: str, sep: str = '') -> str:
     return c
 
 
-def fx_rate(from_curr: str, to_curr: str, proxies: dict[str, str] = None) -> float:
+def http_session(pool_size: int = 16) -> requests.Session:
+    """
+    Returns the shared keep-alive HTTP session used by the FX functions, creating it on first use.
+
+    Args:
+        pool_size (int, optional): Connections kept open per host. Only used when the session is created.
+            Defaults to 16.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(user_agent_headers)
+            _session = session
+        return _session
+
+
+def normalize_currency(curr: str) -> str:
+    """
+    Returns the lower case code a currency is quoted under (e.g. 'CNH' -> 'cny').
+
+    Args:
+        curr (str): The currency code.
+
+    Returns:
+        str: The normalized currency code.
+    """
+    curr = curr.lower()
+    return currency_mapper.get(curr, curr)
+
+
+def _quote_pair(c1: str, c2: str) -> tuple[str, str]:
+    """
+    Returns the normalized pair of c1 and c2 in market convention order, the direction it is fetched and cached in.
+    """
+    return (c1, c2) if cross(c1, c2) == c1 + c2 else (c2, c1)
+
+
+def _cached_rate(from_curr: str, to_curr: str, ttl: float) -> float | None:
+    """
+    Returns the cached rate of the normalized pair, answering inverse pairs by reciprocal, or None when missing or
+    older than ttl seconds.
+    """
+    now = time.monotonic()
+    with _fx_cache_lock:
+        for pair, inverse in (((from_curr, to_curr), False), ((to_curr, from_curr), True)):
+            entry = _fx_cache.get(pair)
+            if entry is not None and now - entry[1] <= ttl:
+                return 1. / entry[0] if inverse else entry[0]
+    return None
+
+
+def _fetch_rate(from_curr: str, to_curr: str, proxies: dict[str, str] = None, timeout: float = None) -> float:
+    """
+    Fetches the rate of the normalized pair from the chart endpoint and caches it.
+    """
+    r = http_session().get(f'{chart_url}{from_curr}{to_curr}=X', proxies=proxies, timeout=timeout)
+    r.raise_for_status()
+    ret = r.json()['chart']['result'][0]['meta']['regularMarketPrice']
+    with _fx_cache_lock:
+        _fx_cache[(from_curr, to_curr)] = (ret, time.monotonic())
+    return ret
+
+
+def clear_fx_cache() -> None:
+    """
+    Drops every cached FX rate.
+    """
+    with _fx_cache_lock:
+        _fx_cache.clear()
+
+
+def fx_rate(from_curr: str, to_curr: str, proxies: dict[str, str] = None, ttl: float = None) -> float:
     """
     Retrieve the foreign exchange rate between two currencies using Yahoo Finance API.
 
+    Rates are fetched over a shared keep-alive session in market convention direction and cached for ttl seconds,
+    so the inverse pair is answered from the cache by reciprocal.
+
     Args:
         from_curr (str): The currency code for the base currency.
         to_curr (str): The currency code for the target currency.
+        proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+        ttl (float, optional): Maximum age in seconds of a cached rate. Defaults to fx_cache_ttl.
 
     Returns:
         float: The exchange rate from the base currency to the target currency.
@@ -59,19 +173,721 @@ def fx_rate(from_curr: str, to_curr: str, proxies: dict[str, str] = None) -> flo
     Raises:
         KeyError: If the JSON response from Yahoo Finance API does not contain the expected data.
     """
+    return fx_rates([(from_curr, to_curr)], proxies=proxies, ttl=ttl)[(from_curr, to_curr)]
+
+
+def fx_rates(pairs: Iterable[tuple[str, str]], proxies: dict[str, str] = None, ttl: float = None,
+             max_workers: int = 8) -> dict[tuple[str, str], float]:
+    """
+    Retrieve the foreign exchange rates of several currency pairs, fetching each distinct uncached pair once and
+    concurrently.
+
+    Args:
+        pairs (Iterable[tuple[str, str]]): The (base currency, target currency) pairs.
+        proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+        ttl (float, optional): Maximum age in seconds of a cached rate. Defaults to fx_cache_ttl.
+        max_workers (int, optional): Maximum number of concurrent requests. Defaults to 8.
+
+    Returns:
+        dict[tuple[str, str], float]: The exchange rate of each pair, keyed by the pairs as given.
+
+    Raises:
+        KeyError: If the JSON response from Yahoo Finance API does not contain the expected data.
+    """
+    ttl = fx_cache_ttl if ttl is None else ttl
+    pairs = list(pairs)
+    normalized = {pair: (normalize_currency(pair[0]), normalize_currency(pair[1])) for pair in pairs}
+    cached = {n: _cached_rate(*n, ttl) for n in set(normalized.values()) if n[0] != n[1]}
+    missing = {_quote_pair(*n) for n, rate in cached.items() if rate is None}
+    fetched = {}
+    if len(missing) == 1:
+        pair = missing.pop()
+        fetched[pair] = _fetch_rate(*pair, proxies=proxies)
+    elif missing:
+        missing = sorted(missing)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            fetched = dict(zip(missing, executor.map(lambda p: _fetch_rate(*p, proxies=proxies), missing)))
+
+    ret = {}
+    for pair, (from_curr, to_curr) in normalized.items():
+        if from_curr == to_curr:
+            ret[pair] = 1  # Return 1 if the base and target currencies are the same
+        elif (from_curr, to_curr) in fetched:
+            ret[pair] = fetched[(from_curr, to_curr)]
+        elif (to_curr, from_curr) in fetched:
+            ret[pair] = 1. / fetched[(to_curr, from_curr)]
+        else:
+            ret[pair] = cached[(from_curr, to_curr)]
+    return ret
+
+
+def _to_timestamp(when) -> int:
+    """
+    Returns the unix timestamp in seconds of a date-like value.
+    """
+    when = pd.Timestamp(when)
+    if when.tzinfo is None:
+        when = when.tz_localize('UTC')
+    return int(when.timestamp())
+
+
+def fx_history(from_curr: str, to_curr: str, start=None, end=None, proxies: dict[str, str] = None) -> pd.Series:
+    """
+    Retrieve the daily close series of the exchange rate between two currencies using Yahoo Finance API.
+
+    Args:
+        from_curr (str): The currency code for the base currency.
+        to_curr (str): The currency code for the target currency.
+        start (optional): First date of the series. Defaults to one year before end.
+        end (optional): Last date of the series. Defaults to now.
+        proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+
+    Returns:
+        pd.Series: The daily exchange rates indexed by date.
 
-    mapper = {
-        'cnh': 'cny'
+    Raises:
+        KeyError: If the JSON response from Yahoo Finance API does not contain the expected data.
+    """
+    from_curr, to_curr = normalize_currency(from_curr), normalize_currency(to_curr)
+    end = pd.Timestamp.now(tz='UTC') if end is None else end
+    start = pd.Timestamp(end) - pd.DateOffset(years=1) if start is None else start
+    name = f'{from_curr}{to_curr}'
+    if from_curr == to_curr:
+        index = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+        return pd.Series(1., index=index.tz_localize(None), name=name)
+
+    quote_from, quote_to = _quote_pair(from_curr, to_curr)
+    params = {
+        'period1': _to_timestamp(start),
+        'period2': _to_timestamp(end) + 86400,  # period2 is exclusive
+        'interval': '1d',
     }
-    from_curr = mapper.get(from_curr.lower(), from_curr)
-    to_curr = mapper.get(to_curr.lower(), to_curr)
+    r = http_session().get(f'{chart_url}{quote_from}{quote_to}=X', params=params, proxies=proxies)
+    r.raise_for_status()
+    result = r.json()['chart']['result'][0]
+    # daily bars are stamped at the exchange's midnight (e.g. 23:00 UTC for London in summer), date them there
+    meta = result.get('meta', {})
+    index = pd.to_datetime(result.get('timestamp', []), unit='s', utc=True)
+    if meta.get('exchangeTimezoneName'):
+        index = index.tz_convert(meta['exchangeTimezoneName']).tz_localize(None)
+    else:
+        index = index.tz_localize(None) + pd.Timedelta(seconds=meta.get('gmtoffset', 0))
+    index = index.normalize()
+    values = np.array(result['indicators']['quote'][0]['close'] if len(index) else [], dtype=float)
+    ret = pd.Series(values, index=index, name=name).dropna()
+    ret = ret[~ret.index.duplicated(keep='last')]
+    return 1. / ret if quote_from != from_curr else ret
 
-    if from_curr.lower() == to_curr.lower():
-        return 1  # Return 1 if the base and target currencies are the same
 
-    url = f'https://query1.finance.yahoo.com/v8/finance/chart/{from_curr}{to_curr}=X'
-    r = requests.get(url, proxies=proxies, headers=user_agent_headers)
+def asof_values(index: pd.DatetimeIndex, values: np.ndarray, when) -> np.ndarray:
+    """
+    Returns for each of the given timestamps the last value at or before it, NaN when there is none.
 
-    ret = r.json()['chart']['result'][0]['meta']['regularMarketPrice']
+    Args:
+        index (pd.DatetimeIndex): The sorted timestamps of the values.
+        values (np.ndarray): The values.
+        when: The timestamps to look up.
+
+    Returns:
+        np.ndarray: The value as of each timestamp.
+    """
+    pos = np.searchsorted(index.values, pd.DatetimeIndex(when).values, side='right') - 1
+    ret = np.asarray(values, dtype=float)[np.maximum(pos, 0)] if len(values) else np.full(len(pos), np.nan)
+    ret[pos < 0] = np.nan
+    return ret
+
+
+def _dated_rates(currencies: list[str], to_curr: str, dates: pd.DatetimeIndex, proxies: dict[str, str] = None,
+                 history: 'FxHistoryStore' = None, max_workers: int = 8) -> np.ndarray:
+    """
+    Returns the (dates, currencies) matrix of as-of exchange rates to to_curr, fetching one series per currency,
+    through the history store when given.
+    """
+    start, end = dates.min() - pd.Timedelta(days=7), dates.max()  # a week back so early dates have a rate as of
+
+    def fetch(curr):
+        if history is not None:
+            return history.series(curr, to_curr, start=start, end=end)
+        return fx_history(curr, to_curr, start=start, end=end, proxies=proxies)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(currencies)))) as executor:
+        series = list(executor.map(fetch, currencies))
+    ret = np.empty((len(dates), len(currencies)))
+    for k, s in enumerate(series):
+        ret[:, k] = asof_values(s.index, s.values, dates)
+    return ret
+
+
+def convert_frame(df: pd.DataFrame, currency_col: str, value_cols: str | list[str], to_curr: str,
+                  date_col: str = None, proxies: dict[str, str] = None, ttl: float = None,
+                  history: 'FxHistoryStore' = None) -> pd.DataFrame:
+    """
+    Converts the values of a frame with a currency column into a single currency.
+
+    Each distinct currency is fetched once, the spot rate when date_col is None and otherwise the daily series
+    looked up as of each row's date, and the values are converted in one vectorized multiply.
+
+    Args:
+        df (pd.DataFrame): The frame to convert.
+        currency_col (str): The column holding the currency code of each row.
+        value_cols (str | list[str]): The columns to convert.
+        to_curr (str): The currency code to convert to.
+        date_col (str, optional): The column holding the date of each row. Defaults to None.
+        proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+        ttl (float, optional): Maximum age in seconds of a cached spot rate. Defaults to fx_cache_ttl.
+        history (FxHistoryStore, optional): Store serving the daily series when date_col is given. Defaults to None.
 
+    Returns:
+        pd.DataFrame: A copy of the frame with the values converted, NaN where the currency is missing.
+    """
+    value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+    codes, currencies = pd.factorize(df[currency_col].map(normalize_currency, na_action='ignore'))
+    currencies = list(currencies)
+    if date_col is None:
+        rates = fx_rates([(c, to_curr) for c in currencies], proxies=proxies, ttl=ttl)
+        factor = np.append(np.array([rates[(c, to_curr)] for c in currencies], dtype=float), np.nan)[codes]
+    else:
+        dates = pd.DatetimeIndex(pd.to_datetime(df[date_col])).normalize()
+        rates = _dated_rates(currencies, to_curr, dates, proxies=proxies, history=history)
+        rates = np.hstack([rates, np.full((len(dates), 1), np.nan)])
+        factor = rates[np.arange(len(dates)), codes]
+
+    ret = df.copy()
+    ret[value_cols] = df[value_cols].to_numpy(dtype=float) * factor[:, np.newaxis]
+    return ret
+
+
+def convert_historical_frame(df: pd.DataFrame, currencies: str | dict[str, str], to_curr: str,
+                             value_cols: str | list[str] = None, proxies: dict[str, str] = None,
+                             history: 'FxHistoryStore' = None) -> pd.DataFrame:
+    """
+    Converts a date indexed frame, such as HistoricalDataResponse.as_frame(), into a single currency using the
+    daily rate as of each date.
+
+    Args:
+        df (pd.DataFrame): The frame to convert, with a DatetimeIndex and security columns, or (security, field)
+            columns.
+        currencies (str | dict[str, str]): The currency code of every security, or a single code for all of them.
+        to_curr (str): The currency code to convert to.
+        value_cols (str | list[str], optional): The fields to convert, matched against the last column level,
+            e.g. ['PX_LAST'], leaving volumes, counts and ratios unchanged. Defaults to None, every numeric column.
+        proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+        history (FxHistoryStore, optional): Store serving the daily series. Defaults to None.
+
+    Returns:
+        pd.DataFrame: A copy of the frame with the values converted, NaN for securities without a currency. Other
+            columns, and non-numeric ones such as CRNCY or dates, are passed through unchanged.
+    """
+    sids = df.columns.get_level_values(0)
+    if isinstance(currencies, str):
+        column_currencies = pd.Series(normalize_currency(currencies), index=range(len(sids)))
+    else:
+        column_currencies = pd.Series(sids.map(currencies)).map(normalize_currency, na_action='ignore')
+    codes, distinct = pd.factorize(column_currencies)
+    dates = pd.DatetimeIndex(df.index).normalize()
+    if len(dates):
+        rates = _dated_rates(list(distinct), to_curr, dates, proxies=proxies, history=history)
+    else:
+        rates = np.empty((0, len(distinct)))
+    rates = np.hstack([rates, np.full((len(dates), 1), np.nan)])
+    converted = np.array([pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t) for t in df.dtypes],
+                         dtype=bool)
+    if value_cols is not None:
+        value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+        converted &= df.columns.get_level_values(-1).isin(value_cols)
+    ret = df.copy()
+    cols = np.flatnonzero(converted)
+    values = df.iloc[:, cols].to_numpy(dtype=float) * rates[:, codes[cols]]
+    for k, col in enumerate(cols):
+        ret.isetitem(col, values[:, k])
     return ret
+
+
+class FxMatrix:
+    """
+    Cross rates between a basket of currencies, triangulated through a pivot currency so that N currencies only
+    need N - 1 fetched rates.
+    """
+
+    def __init__(self, currencies: Iterable[str], pivot: str = 'usd', proxies: dict[str, str] = None,
+                 ttl: float = None):
+        """
+        Fetches the pivot rate of every currency of the basket and builds the cross matrix.
+
+        Args:
+            currencies (Iterable[str]): The currency codes of the basket. 'cnh' style codes are mapped with
+                currency_mapper.
+            pivot (str, optional): The currency every rate is fetched against. Defaults to 'usd'.
+            proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+            ttl (float, optional): Maximum age in seconds of a cached pivot rate. Defaults to fx_cache_ttl.
+        """
+        self.pivot = normalize_currency(pivot)
+        self.proxies = proxies
+        self.ttl = ttl
+        self.currencies = list(dict.fromkeys([self.pivot] + [normalize_currency(c) for c in currencies]))
+        self.index = {c: i for i, c in enumerate(self.currencies)}
+        self.matrix = None
+        self.refresh()
+
+    def __repr__(self) -> str:
+        return f'<FxMatrix(pivot={self.pivot}, currencies={len(self.currencies)})>'
+
+    def __contains__(self, curr: str) -> bool:
+        return normalize_currency(curr) in self.index
+
+    def __getitem__(self, pair: tuple[str, str]) -> float:
+        return self.rate(*pair)
+
+    def refresh(self) -> None:
+        """
+        Refetches the pivot rates in a single round of concurrent requests and rebuilds the cross matrix.
+        """
+        pairs = [(self.pivot, c) for c in self.currencies]
+        rates = fx_rates(pairs, proxies=self.proxies, ttl=self.ttl)
+        # units of each currency per unit of pivot, the cross rate from i to j is then v[j] / v[i]
+        v = np.array([rates[pair] for pair in pairs], dtype=float)
+        self.matrix = v[np.newaxis, :] / v[:, np.newaxis]
+
+    def rate(self, from_curr: str, to_curr: str) -> float:
+        """
+        Returns the exchange rate from the base currency to the target currency.
+
+        Args:
+            from_curr (str): The currency code for the base currency.
+            to_curr (str): The currency code for the target currency.
+
+        Returns:
+            float: The exchange rate from the base currency to the target currency.
+
+        Raises:
+            KeyError: If either currency is not part of the basket.
+        """
+        return float(self.matrix[self.index[normalize_currency(from_curr)], self.index[normalize_currency(to_curr)]])
+
+    def rates(self, from_currs: Iterable[str], to_currs: Iterable[str] | str) -> np.ndarray:
+        """
+        Returns the exchange rates of many pairs at once.
+
+        Args:
+            from_currs (Iterable[str]): The currency codes for the base currencies.
+            to_currs (Iterable[str] | str): The currency codes for the target currencies, or a single target
+                currency for all of them.
+
+        Returns:
+            np.ndarray: The exchange rate of each pair.
+
+        Raises:
+            KeyError: If any currency is not part of the basket.
+        """
+        i = np.array([self.index[normalize_currency(c)] for c in from_currs], dtype=np.intp)
+        if isinstance(to_currs, str):
+            j = self.index[normalize_currency(to_currs)]
+        else:
+            j = np.array([self.index[normalize_currency(c)] for c in to_currs], dtype=np.intp)
+        return self.matrix[i, j]
+
+    def cross(self, c1: str, c2: str, sep: str = '') -> tuple[str, float]:
+        """
+        Returns the cross currency pair of c1 and c2 according to market convention together with its rate.
+
+        Args:
+            c1 (str): Currency 1.
+            c2 (str): Currency 2.
+            sep (str, optional): Separator for the cross currency pair. Defaults to ''.
+
+        Returns:
+            tuple[str, float]: The cross currency pair and its rate.
+        """
+        c1, c2 = _quote_pair(normalize_currency(c1), normalize_currency(c2))
+        return cross(c1, c2, sep=sep), self.rate(c1, c2)
+
+    def quotes(self, sep: str = '') -> dict[str, float]:
+        """
+        Returns every cross currency pair of the basket in market convention with its rate.
+
+        Args:
+            sep (str, optional): Separator for the cross currency pairs. Defaults to ''.
+
+        Returns:
+            dict[str, float]: The rate of each cross currency pair.
+        """
+        return dict(self.cross(c1, c2, sep=sep) for i, c1 in enumerate(self.currencies)
+                    for c2 in self.currencies[i + 1:])
+
+
+class FxQuote(NamedTuple):
+    """
+    An exchange rate read from an FxRateService snapshot.
+    """
+    pair: tuple[str, str]
+    rate: float
+    updated: float  # unix time of the fetch
+    age: float  # seconds since the fetch
+    stale: bool  # older than the service's max_age
+
+
+class FxRateService:
+    """
+    Keeps the rates of a set of watched currency pairs refreshed on a background thread.
+
+    Reads are served from an immutable snapshot that is swapped atomically after each refresh, so they never wait
+    on the network. When a refresh fails the previous rates keep being served, flagged stale once older than
+    max_age, and the next attempts back off exponentially.
+    """
+
+    def __init__(self, pairs: Iterable[tuple[str, str]] = (), interval: float = 60., max_age: float = None,
+                 max_backoff: float = 600., proxies: dict[str, str] = None, max_workers: int = 8,
+                 request_timeout: float = 10.):
+        """
+        Args:
+            pairs (Iterable[tuple[str, str]], optional): The (base currency, target currency) pairs to watch.
+                Defaults to ().
+            interval (float, optional): Seconds between refreshes. Defaults to 60.
+            max_age (float, optional): Age in seconds after which a rate is flagged stale. Defaults to 3 intervals.
+            max_backoff (float, optional): Maximum seconds between attempts after failures. Defaults to 600.
+            proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+            max_workers (int, optional): Maximum number of concurrent requests per refresh. Defaults to 8.
+            request_timeout (float, optional): Seconds before a request to a slow endpoint is abandoned.
+                Defaults to 10.
+        """
+        self.interval = interval
+        self.max_age = 3 * interval if max_age is None else max_age
+        self.max_backoff = max_backoff
+        self.proxies = proxies
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.failures = 0
+        self.last_error = None
+        self._pairs = set()
+        self._lock = threading.Lock()
+        self._snapshot = MappingProxyType({})
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.watch(*pairs)
+
+    def __repr__(self) -> str:
+        return f'<FxRateService(pairs={len(self._pairs)}, interval={self.interval}, running={self.is_running})>'
+
+    def __enter__(self) -> 'FxRateService':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def snapshot(self) -> MappingProxyType:
+        """
+        The current read-only mapping of quoted pair -> (rate, unix time of the fetch).
+        """
+        return self._snapshot
+
+    def watch(self, *pairs: tuple[str, str]) -> None:
+        """
+        Adds pairs to the watched set; new pairs are fetched by the next refresh, which is triggered right away.
+        """
+        quoted = {_quote_pair(normalize_currency(c1), normalize_currency(c2)) for c1, c2 in pairs}
+        quoted = {pair for pair in quoted if pair[0] != pair[1]}
+        with self._lock:
+            added = quoted - self._pairs
+            self._pairs |= added
+        if added:
+            self._wake.set()
+
+    def unwatch(self, *pairs: tuple[str, str]) -> None:
+        """
+        Removes pairs from the watched set; their last rates stay in the snapshot.
+        """
+        with self._lock:
+            self._pairs -= {_quote_pair(normalize_currency(c1), normalize_currency(c2)) for c1, c2 in pairs}
+
+    def start(self) -> None:
+        """
+        Starts the background refresh thread, the first refresh running immediately.
+
+        Raises:
+            RuntimeError: If the thread of a previous stop() that timed out is still running.
+        """
+        if self.is_running:
+            if self._stopped.is_set():
+                raise RuntimeError('FxRateService is still stopping, its refresh thread has not exited')
+            return
+        self._stopped.clear()
+        self._wake.set()
+        self._thread = threading.Thread(target=self._run, name='FxRateService', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Stops the background refresh thread, waiting for it up to timeout seconds. A thread still inside a slow
+        refresh exits once it is done, and the service cannot be started again until then.
+        """
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self._thread = None
+
+    def refresh(self) -> None:
+        """
+        Fetches every watched pair and swaps in the new snapshot. Pairs that fail keep their previous rate, as do
+        pairs a concurrent refresh fetched more recently.
+
+        Raises:
+            Exception: The last fetch error when any pair failed, after the successful ones were published.
+        """
+        with self._lock:
+            pairs = sorted(self._pairs)
+        if not pairs:
+            return
+        errors = []
+
+        def fetch(pair):
+            try:
+                return pair, _fetch_rate(*pair, proxies=self.proxies, timeout=self.request_timeout), time.time()
+            except Exception as e:
+                errors.append(e)
+                return pair, None, None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pairs))) as executor:
+            results = list(executor.map(fetch, pairs))
+        with self._lock:
+            snapshot = dict(self._snapshot)
+            for pair, rate, updated in results:
+                if rate is not None and (pair not in snapshot or snapshot[pair][1] < updated):
+                    snapshot[pair] = (rate, updated)
+            self._snapshot = MappingProxyType(snapshot)
+        if errors:
+            raise errors[-1]
+
+    def quote(self, from_curr: str, to_curr: str) -> FxQuote:
+        """
+        Returns the exchange rate from the base currency to the target currency from the current snapshot.
+
+        Args:
+            from_curr (str): The currency code for the base currency.
+            to_curr (str): The currency code for the target currency.
+
+        Returns:
+            FxQuote: The rate with its fetch time, age and staleness.
+
+        Raises:
+            KeyError: If the pair has not been fetched yet.
+        """
+        from_curr, to_curr = normalize_currency(from_curr), normalize_currency(to_curr)
+        now = time.time()
+        if from_curr == to_curr:
+            return FxQuote((from_curr, to_curr), 1., now, 0., False)
+        snapshot = self._snapshot
+        if (from_curr, to_curr) in snapshot:
+            rate, updated = snapshot[(from_curr, to_curr)]
+        elif (to_curr, from_curr) in snapshot:
+            rate, updated = snapshot[(to_curr, from_curr)]
+            rate = 1. / rate
+        else:
+            raise KeyError(f'{from_curr}{to_curr} has not been fetched')
+        age = now - updated
+        return FxQuote((from_curr, to_curr), rate, updated, age, age > self.max_age)
+
+    def rate(self, from_curr: str, to_curr: str) -> float:
+        """
+        Returns the exchange rate from the base currency to the target currency from the current snapshot.
+
+        Raises:
+            KeyError: If the pair has not been fetched yet.
+        """
+        return self.quote(from_curr, to_curr).rate
+
+    def _run(self) -> None:
+        delay = 0.
+        while not self._stopped.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.refresh()
+                self.failures = 0
+                self.last_error = None
+                delay = self.interval
+            except Exception as e:
+                self.failures += 1
+                self.last_error = e
+                delay = min(self.interval * 2 ** (self.failures - 1), self.max_backoff)
+                logger.warning('FX refresh failed (%d in a row), retrying in %.1fs: %s', self.failures, delay, e)
+
+
+class FxHistoryStore:
+    """
+    Local store of daily FX close series, one columnar .npz file per pair in market convention direction.
+
+    Each file keeps the dates, the closes and the range already requested from the chart endpoint, so later calls
+    only fetch the days outside it. The last stored day is refetched with them since it may have been an
+    intraday value.
+    """
+
+    def __init__(self, path: str = DEFAULT_FX_HISTORY_PATH, proxies: dict[str, str] = None,
+                 default_start='2000-01-01'):
+        """
+        Args:
+            path (str, optional): Folder of the store. Defaults to DEFAULT_FX_HISTORY_PATH.
+            proxies (dict[str, str], optional): Proxies passed to requests. Defaults to None.
+            default_start (optional): First date fetched when a series is requested without start.
+                Defaults to '2000-01-01'.
+        """
+        self.path = path
+        self.proxies = proxies
+        self.default_start = pd.Timestamp(default_start)
+        self._series = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f'<FxHistoryStore(path={self.path}, pairs={len(self.pairs())})>'
+
+    def file_path(self, pair: tuple[str, str]) -> str:
+        return os.path.join(self.path, f'{pair[0]}{pair[1]}.npz')
+
+    def pairs(self) -> list[tuple[str, str]]:
+        """
+        Returns the stored pairs.
+        """
+        names = [f[:-4] for f in sorted(os.listdir(self.path)) if f.endswith('.npz') and len(f) == 10]
+        return [(n[:3], n[3:]) for n in names]
+
+    def _pair_lock(self, pair: tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(pair, threading.Lock())
+
+    def _load(self, pair: tuple[str, str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the (dates as datetime64[ns], closes, requested [start, end] range) of the pair.
+        """
+        if pair not in self._series:
+            file_path = self.file_path(pair)
+            if os.path.exists(file_path):
+                with np.load(file_path) as data:
+                    self._series[pair] = data['dates'], data['closes'], data['requested']
+            else:
+                empty = np.array([], dtype='datetime64[ns]')
+                self._series[pair] = empty, np.array([], dtype=float), empty
+        return self._series[pair]
+
+    def _save(self, pair: tuple[str, str], dates: np.ndarray, closes: np.ndarray, requested: np.ndarray) -> None:
+        file_path = self.file_path(pair)
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, dates=dates, closes=closes, requested=requested)
+        os.replace(tmp_path, file_path)
+        self._series[pair] = dates, closes, requested
+
+    def update(self, from_curr: str, to_curr: str, start=None, end=None) -> None:
+        """
+        Fetches the days of [start, end] missing from the stored series of the pair.
+
+        Args:
+            from_curr (str): The currency code for the base currency.
+            to_curr (str): The currency code for the target currency.
+            start (optional): First date needed. Defaults to the stored start, or default_start.
+            end (optional): Last date needed. Defaults to today.
+        """
+        pair = _quote_pair(normalize_currency(from_curr), normalize_currency(to_curr))
+        if pair[0] == pair[1]:
+            return
+        end = pd.Timestamp.now().normalize() if end is None else pd.Timestamp(end).normalize()
+        with self._pair_lock(pair):
+            dates, closes, requested = self._load(pair)
+            if len(requested):
+                have_start, have_end = pd.Timestamp(requested[0]), pd.Timestamp(requested[1])
+                start = have_start if start is None else pd.Timestamp(start).normalize()
+                ranges = []
+                if start < have_start:
+                    ranges.append((start, have_start))
+                if end > have_end:
+                    ranges.append((pd.Timestamp(dates[-1]) if len(dates) else have_end, end))
+            else:
+                start = self.default_start if start is None else pd.Timestamp(start).normalize()
+                ranges = [(start, end)] if start <= end else []
+            if not ranges:
+                return
+
+            series = [pd.Series(closes, index=pd.DatetimeIndex(dates))]
+            series += [fx_history(*pair, start=s, end=e, proxies=self.proxies) for s, e in ranges]
+            merged = pd.concat(series)
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+            bounds = [start, end] + ([have_start, have_end] if len(requested) else [])
+            requested = np.array([min(bounds), max(bounds)], dtype='datetime64[ns]')
+            self._save(pair, merged.index.values.astype('datetime64[ns]'), merged.values.astype(float), requested)
+
+    def series(self, from_curr: str, to_curr: str, start=None, end=None, update: bool = True) -> pd.Series:
+        """
+        Returns the daily exchange rates from the base currency to the target currency.
+
+        Args:
+            from_curr (str): The currency code for the base currency.
+            to_curr (str): The currency code for the target currency.
+            start (optional): First date. Defaults to the first stored date.
+            end (optional): Last date. Defaults to today.
+            update (bool, optional): Whether to fetch the missing days first. Defaults to True.
+
+        Returns:
+            pd.Series: The daily exchange rates indexed by date.
+        """
+        from_curr, to_curr = normalize_currency(from_curr), normalize_currency(to_curr)
+        if from_curr == to_curr:
+            return fx_history(from_curr, to_curr, start=start or self.default_start, end=end)
+        if update:
+            self.update(from_curr, to_curr, start=start, end=end)
+        pair = _quote_pair(from_curr, to_curr)
+        dates, closes, _ = self._load(pair)
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start), 'ns'), side='left')
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end), 'ns'), side='right')
+        values = closes[lo:hi] if pair == (from_curr, to_curr) else 1. / closes[lo:hi]
+        return pd.Series(values, index=pd.DatetimeIndex(dates[lo:hi]), name=f'{from_curr}{to_curr}')
+
+    def asof(self, from_curr: str, to_curr: str, when, update: bool = True) -> np.ndarray:
+        """
+        Returns the exchange rate as of each of the given timestamps, the last close at or before it.
+
+        Args:
+            from_curr (str): The currency code for the base currency.
+            to_curr (str): The currency code for the target currency.
+            when: The timestamps to look up.
+            update (bool, optional): Whether to fetch the missing days first. Defaults to True.
+
+        Returns:
+            np.ndarray: The exchange rate as of each timestamp, NaN before the first stored close.
+        """
+        when = pd.DatetimeIndex(when)
+        if normalize_currency(from_curr) == normalize_currency(to_curr):
+            return np.ones(len(when))
+        if update and len(when):
+            self.update(from_curr, to_curr, start=when.min() - pd.Timedelta(days=7), end=when.max())
+        s = self.series(from_curr, to_curr, update=False)
+        return asof_values(s.index, s.values, when)
+
+    def frame(self, pairs: Iterable[tuple[str, str]], start=None, end=None, update: bool = True) -> pd.DataFrame:
+        """
+        Returns the daily exchange rates of several pairs aligned on the union of their dates, each pair as of
+        every date.
+
+        Args:
+            pairs (Iterable[tuple[str, str]]): The (base currency, target currency) pairs.
+            start (optional): First date. Defaults to the first stored date.
+            end (optional): Last date. Defaults to today.
+            update (bool, optional): Whether to fetch the missing days first. Defaults to True.
+
+        Returns:
+            pd.DataFrame: The exchange rates with a date index and a column per pair.
+        """
+        series = [self.series(c1, c2, start=start, end=end, update=update) for c1, c2 in pairs]
+        index = pd.DatetimeIndex(np.unique(np.concatenate([s.index.values for s in series]))) if series \
+            else pd.DatetimeIndex([])
+        return pd.DataFrame({s.name: asof_values(s.index, s.values, index) for s in series}, index=index)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+import finance
+
+
+def test_convert_historical_frame_mixed_fields(monkeypatch):
+    rates = {'eur': 1.1, 'gbp': 1.3}
+
+    def dated_rates(currencies, to_curr, dates, **kwargs):
+        return np.array([[rates[c] for c in currencies]] * len(dates))
+
+    monkeypatch.setattr(finance, '_dated_rates', dated_rates)
+    dates = pd.date_range('2024-01-02', periods=3)
+    df = pd.DataFrame({
+        ('A', 'PX_LAST'): [1., 2., 3.],
+        ('A', 'PX_VOLUME'): [10, 20, 30],
+        ('A', 'CRNCY'): ['EUR'] * 3,
+        ('A', 'LAST_UPDATE_DT'): dates,
+        ('B', 'PX_LAST'): [4., 5., 6.],
+        ('B', 'PX_VOLUME'): [40, 50, 60],
+        ('B', 'CRNCY'): ['GBP'] * 3,
+        ('B', 'LAST_UPDATE_DT'): dates,
+    }, index=dates)
+
+    ret = finance.convert_historical_frame(df, {'A': 'EUR', 'B': 'GBP'}, 'USD', value_cols=['PX_LAST'])
+
+    np.testing.assert_allclose(ret[('A', 'PX_LAST')], [1.1, 2.2, 3.3])
+    np.testing.assert_allclose(ret[('B', 'PX_LAST')], [5.2, 6.5, 7.8])
+    for sid in 'AB':
+        for field in ('PX_VOLUME', 'CRNCY', 'LAST_UPDATE_DT'):
+            pd.testing.assert_series_equal(ret[(sid, field)], df[(sid, field)])
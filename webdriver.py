@@ -5,13 +5,34 @@ Module containing custom functions related to web drivers.
 Author: Antonio Ventilii
 """
 
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import json
 import os
+import queue
+import re
+import select
 import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
 
 import requests
+import urllib3
 from requests import Response
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
@@ -29,6 +50,74 @@ CUSTOM_PROXIES = {
 
 DEFAULT_USER_HOME_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache')
 
+DRIVER_MANIFEST_PATH = os.path.join(DEFAULT_USER_HOME_CACHE_PATH, 'webdriver_manifest.json')
+
+# Days a resolved driver binary is used before upstream is checked for a newer version
+DRIVER_REFRESH_DAYS = 7
+
+_manifest_lock = threading.Lock()  # held only while reading or writing the manifest
+_install_locks = {}  # driver name -> lock serialising its installs
+
+# Profile entries not worth copying: caches, crash and telemetry data, and the lock files of a running browser
+PROFILE_SYNC_IGNORE = (
+    'cache2', 'startupCache', 'shader-cache', 'thumbnails', 'crashes', 'minidumps', 'datareporting',
+    'saved-telemetry-pings', 'lock', '.parentlock', '*parent.lock', '*.lock',
+)
+
+PROFILE_POINTER_FILE = 'current'
+
+PROFILE_MIRROR_FOLDER = 'mirror'
+
+# URL patterns of fonts and media, blocked in Chrome's performance mode (Firefox turns them off with preferences)
+PERFORMANCE_BLOCKED_URLS = (
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*.mp4', '*.webm', '*.ogg', '*.mp3', '*.m4a', '*.wav',
+)
+
+# Firefox preferences of the performance mode: no images, web fonts, media autoplay, telemetry, prefetching,
+# safe browsing lookups or extension updates
+FIREFOX_PERFORMANCE_PREFERENCES = {
+    'permissions.default.image': 2,
+    'gfx.downloadable_fonts.enabled': False,
+    'browser.display.use_document_fonts': 0,
+    'media.autoplay.default': 5,
+    'media.mediasource.enabled': False,
+    'toolkit.telemetry.enabled': False,
+    'toolkit.telemetry.unified': False,
+    'toolkit.telemetry.archive.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'app.normandy.enabled': False,
+    'app.shield.optoutstudies.enabled': False,
+    'browser.ping-centre.telemetry': False,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'browser.safebrowsing.downloads.enabled': False,
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.http.speculative-parallel-limit': 0,
+    'browser.newtabpage.enabled': False,
+    'browser.startup.page': 0,
+    'extensions.update.enabled': False,
+    'extensions.getAddons.cache.enabled': False,
+    'extensions.pocket.enabled': False,
+    'extensions.screenshots.disabled': True,
+    'extensions.formautofill.addresses.enabled': False,
+}
+
+# Chrome switches of the performance mode
+CHROME_PERFORMANCE_ARGUMENTS = (
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-component-extensions-with-background-pages',
+    '--disable-background-networking',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--metrics-recording-only',
+    '--no-first-run',
+    '--mute-audio',
+    '--autoplay-policy=user-gesture-required',
+)
+
 
 def firefox_profile_path() -> str:
     """
@@ -74,29 +163,311 @@ def download_manager() -> WDMDownloadManager:
     return WDMDownloadManager(http_client)
 
 
-def chromedriver_path() -> str:
+def _driver_version(path: str) -> str | None:
+    """
+    Returns the driver version found in the WebDriverManager install path, e.g. '0.34.0' from
+    '.wdm/drivers/geckodriver/linux64/v0.34.0/geckodriver'.
+    """
+    for part in reversed(os.path.normpath(path).split(os.sep)):
+        if re.fullmatch(r'v?\d+(\.\d+)+', part):
+            return part.lstrip('v')
+    return None
+
+
+def read_driver_manifest(manifest_path: str = DRIVER_MANIFEST_PATH) -> dict:
+    """
+    Returns the manifest of resolved driver binaries, {name: {'path', 'version', 'resolved'}}.
+
+    Args:
+        manifest_path (str): Path to the manifest file. Defaults to DRIVER_MANIFEST_PATH.
+
+    Returns:
+        dict: The manifest, empty when the file is missing or unreadable.
+    """
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_driver_manifest(manifest: dict, manifest_path: str) -> None:
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def resolve_driver(name: str, install: Callable[[str | None], str], version: str = None, refresh: bool = False,
+                   offline: bool = False, refresh_days: float = DRIVER_REFRESH_DAYS,
+                   manifest_path: str = DRIVER_MANIFEST_PATH) -> str:
+    """
+    Returns the path to a driver binary, resolving it through the local manifest first.
+
+    Upstream is only queried when the manifest has no usable entry, when it is older than refresh_days or on
+    explicit refresh. A pinned version is downloaded once and then never re-checked, and offline mode never
+    touches the network. When upstream cannot be reached the last resolved binary is used.
+
+    Args:
+        name (str): The driver name, the manifest key.
+        install (Callable[[str | None], str]): Function installing the given version (None for the latest) and
+            returning its path.
+        version (str): Version to pin. Defaults to None, the latest.
+        refresh (bool): Whether to check upstream regardless of the manifest age. Defaults to False.
+        offline (bool): Whether to only use the manifest. Defaults to False.
+        refresh_days (float): Days after which upstream is checked again. Defaults to DRIVER_REFRESH_DAYS.
+        manifest_path (str): Path to the manifest file. Defaults to DRIVER_MANIFEST_PATH.
+
+    Returns:
+        str: The path to the driver executable.
+
+    Raises:
+        FileNotFoundError: If offline and the manifest has no usable binary.
+    """
+    def cached():  # the usable manifest entry or None, and whether it is used without checking upstream
+        with _manifest_lock:
+            entry = read_driver_manifest(manifest_path).get(name)
+        if entry is None or not os.path.exists(entry['path']) \
+                or (version is not None and entry.get('version') != version.lstrip('v')):
+            return None, False
+        age = datetime.now() - datetime.fromisoformat(entry['resolved'])
+        return entry, offline or version is not None or (not refresh and age.total_seconds() <= refresh_days * 86400)
+
+    entry, fresh = cached()
+    if fresh:
+        return entry['path']
+    if offline:
+        raise FileNotFoundError(f'No usable cached {name} binary in {manifest_path}')
+
+    with _manifest_lock:
+        install_lock = _install_locks.setdefault(name, threading.Lock())
+    with install_lock:
+        if not refresh:
+            entry, fresh = cached()  # installed by another thread while waiting
+            if fresh:
+                return entry['path']
+        try:
+            path = install(version)
+        except Exception as e:
+            if entry is not None:
+                log(f'Could not check {name} upstream, using {entry["path"]}: {e}')
+                return entry['path']
+            raise
+        with _manifest_lock:
+            manifest = read_driver_manifest(manifest_path)
+            manifest[name] = {
+                'path': path,
+                'version': _driver_version(path),
+                'resolved': datetime.now().isoformat(timespec='seconds'),
+            }
+            _write_driver_manifest(manifest, manifest_path)
+    return path
+
+
+def chromedriver_path(version: str = None, refresh: bool = False, offline: bool = False) -> str:
     """
     Returns the path to the ChromeDriver executable.
 
+    Args:
+        version (str): ChromeDriver version to pin. Defaults to None, the latest.
+        refresh (bool): Whether to check upstream for a newer version now. Defaults to False.
+        offline (bool): Whether to never touch the network. Defaults to False.
+
     Returns:
         str: The path to the ChromeDriver executable.
     """
-    return ChromeDriverManager(download_manager=download_manager()).install()
+    def install(v):
+        return ChromeDriverManager(driver_version=v, download_manager=download_manager()).install()
+
+    return resolve_driver('chromedriver', install, version=version, refresh=refresh, offline=offline)
 
 
-def geckodriver_path() -> str:
+def geckodriver_path(version: str = None, refresh: bool = False, offline: bool = False) -> str:
     """
     Returns the path to the GeckoDriver executable.
 
+    Args:
+        version (str): GeckoDriver version to pin, e.g. 'v0.34.0'. Defaults to None, the latest.
+        refresh (bool): Whether to check upstream for a newer version now. Defaults to False.
+        offline (bool): Whether to never touch the network. Defaults to False.
+
     Returns:
         str: The path to the GeckoDriver executable.
     """
-    return GeckoDriverManager(download_manager=download_manager()).install()
+    def install(v):
+        return GeckoDriverManager(version=v, download_manager=download_manager()).install()
+
+    return resolve_driver('geckodriver', install, version=version, refresh=refresh, offline=offline)
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def current_profile(dst_folder: str) -> str | None:
+    """
+    Returns the current snapshot of a profile synced with sync_profile, or None if there is none.
+
+    Args:
+        dst_folder (str): The folder holding the profile snapshots.
+
+    Returns:
+        str | None: The path to the current profile snapshot.
+    """
+    try:
+        with open(os.path.join(dst_folder, PROFILE_POINTER_FILE)) as f:
+            path = os.path.join(dst_folder, f.read().strip())
+    except OSError:
+        return None
+    return path if os.path.isdir(path) else None
+
+
+def profile_age(dst_folder: str) -> float | None:
+    """
+    Returns the seconds since the profile in dst_folder was last synced, or None if it never was.
+
+    Args:
+        dst_folder (str): The folder holding the profile snapshots.
+
+    Returns:
+        float | None: The age of the current snapshot in seconds.
+    """
+    if current_profile(dst_folder) is None:
+        return None
+    return time.time() - os.path.getmtime(os.path.join(dst_folder, PROFILE_POINTER_FILE))
+
+
+def sync_profile(src_folder: str, dst_folder: str, ignore: tuple[str, ...] = PROFILE_SYNC_IGNORE,
+                 checksum: bool = False, max_workers: int = 8, keep: int = 2, verbose: bool = False) -> str:
+    """
+    Incrementally copies a browser profile into a new snapshot folder of dst_folder and makes it current.
+
+    The profile is first synced into a mirror folder that is never launched: only files whose size or
+    modification time differ from the mirror (or, with checksum, whose content differs) are read from the
+    source, copying in parallel. The snapshot is then a plain copy of the mirror, so browsers launched from
+    different snapshots never share files. It is made current by atomically replacing a pointer file, so
+    concurrent launches never see a half-copied profile. Concurrent syncs share the mirror, each leaving the
+    in-flight copies of the others alone.
+
+    Args:
+        src_folder (str): The profile folder to copy.
+        dst_folder (str): The folder holding the mirror and the profile snapshots.
+        ignore (tuple[str, ...]): Glob patterns of file and folder names to skip. Defaults to PROFILE_SYNC_IGNORE.
+        checksum (bool): Whether to compare the content of files whose size matches but modification time
+            differs. Defaults to False.
+        max_workers (int): Number of threads copying files. Defaults to 8.
+        keep (int): Number of snapshots kept, at least 2: the current one and the previous one, which a launch
+            may still be starting from. Older ones are removed even when a browser still runs from them, so keep
+            must exceed the number of browsers launched from dst_folder running at once. Defaults to 2.
+        verbose (bool): Whether to display verbose output. Defaults to False.
+
+    Returns:
+        str: The path to the new profile snapshot.
+    """
+    if current_profile(dst_folder) is None and os.path.isdir(dst_folder) \
+            and not os.path.isdir(os.path.join(dst_folder, PROFILE_MIRROR_FOLDER)):
+        shutil.rmtree(dst_folder)  # plain copy made before snapshots were introduced
+    mirror = os.path.join(dst_folder, PROFILE_MIRROR_FOLDER)
+    os.makedirs(mirror, exist_ok=True)
+
+    def ignored(entry):
+        return any(fnmatch.fnmatch(entry, pattern) for pattern in ignore)
+
+    def in_flight(file):  # temporary file of a copy, possibly by a concurrent sync
+        return re.search(r'\.\d+\.\d+\.tmp$', file) is not None
+
+    def copy(paths):
+        src, dst = paths
+        tmp = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            shutil.copy2(src, tmp)
+            os.replace(tmp, dst)  # a concurrent sync never sees a half-written mirror file
+        except FileNotFoundError:
+            pass  # removed by the running browser while copying
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    to_copy, synced = [], set()
+    for root, dirs, files in os.walk(src_folder):
+        dirs[:] = [d for d in dirs if not ignored(d)]
+        rel_root = os.path.relpath(root, src_folder)
+        os.makedirs(os.path.join(mirror, rel_root), exist_ok=True)
+        for file in files:
+            src = os.path.join(root, file)
+            if ignored(file) or os.path.islink(src):
+                continue
+            dst = os.path.join(mirror, rel_root, file)
+            synced.add(os.path.normpath(os.path.join(rel_root, file)))
+            try:
+                src_stat = os.stat(src)
+            except FileNotFoundError:
+                continue  # removed by the running browser
+            try:
+                old_stat = os.stat(dst)
+            except OSError:
+                old_stat = None
+            unchanged = old_stat is not None and src_stat.st_size == old_stat.st_size and (
+                abs(src_stat.st_mtime - old_stat.st_mtime) < 1e-3 or (checksum and _file_hash(src) == _file_hash(dst)))
+            if not unchanged:
+                to_copy.append((src, dst))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(copy, to_copy))
+    for root, _, files in os.walk(mirror):
+        for file in files:
+            rel_path = os.path.normpath(os.path.relpath(os.path.join(root, file), mirror))
+            if rel_path not in synced and not in_flight(file):
+                try:
+                    os.remove(os.path.join(root, file))  # deleted from the profile, or now ignored
+                except FileNotFoundError:
+                    pass  # removed by a concurrent sync
+
+    def snapshot_copy(paths):
+        try:
+            shutil.copy2(*paths)
+        except FileNotFoundError:
+            pass  # removed from the mirror by a concurrent sync
+
+    name = f'profile-{time.time_ns()}'
+    tmp_folder = os.path.join(dst_folder, f'.{name}.tmp')
+    try:
+        snapshot_files = []
+        for root, _, files in os.walk(mirror):
+            rel_root = os.path.relpath(root, mirror)
+            os.makedirs(os.path.join(tmp_folder, rel_root), exist_ok=True)
+            snapshot_files += [(os.path.join(root, f), os.path.join(tmp_folder, rel_root, f))
+                               for f in files if not in_flight(f)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(snapshot_copy, snapshot_files))
+        os.replace(tmp_folder, os.path.join(dst_folder, name))
+    finally:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    pointer = os.path.join(dst_folder, PROFILE_POINTER_FILE)
+    with open(f'{pointer}.{os.getpid()}.tmp', 'w') as f:
+        f.write(name)
+    os.replace(f'{pointer}.{os.getpid()}.tmp', pointer)
+    if verbose:
+        print(f'Profile synced into {name}: {len(to_copy)} changed files read from {src_folder}, '
+              f'{len(snapshot_files)} files in the snapshot.')
+
+    protected = {name, os.path.basename(current_profile(dst_folder) or '')}
+    snapshots = sorted(d for d in os.listdir(dst_folder) if d.startswith('profile-'))
+    for old_name in snapshots[:-max(keep, 2)]:
+        if old_name not in protected:
+            shutil.rmtree(os.path.join(dst_folder, old_name), ignore_errors=True)
+    return os.path.join(dst_folder, name)
 
 
 def firefox(headless: bool = False, use_local_profile: bool = False, save_local_profile_to_cache: bool = True,
             profile_folder: str = None, download_dir: str = None, verbose: bool = False,
-            copy_threshold_days: int = 7) -> webdriver.Firefox:
+            copy_threshold_days: int = 7, performance: bool = False, blocked_urls: list[str] = None
+            ) -> webdriver.Firefox:
     """
     Creates a Firefox WebDriver instance with custom options.
 
@@ -108,6 +479,10 @@ def firefox(headless: bool = False, use_local_profile: bool = False, save_local_
         download_dir (str): Directory path for downloads. Defaults to None.
         verbose (bool): Whether to display verbose output. Defaults to False.
         copy_threshold_days (int): Number of days within which the profile should be considered fresh. Defaults to 7.
+        performance (bool): Whether to browse in low-overhead mode: eager page load strategy, no images, fonts or
+            media, no telemetry, prefetching or extension updates. Defaults to False.
+        blocked_urls (list[str]): URL patterns ('*' wildcards) never requested, enforced through a proxy
+            auto-config that replaces the profile's proxy settings. Defaults to None.
 
     Returns:
         webdriver.Firefox: The created Firefox WebDriver instance.
@@ -120,21 +495,15 @@ def firefox(headless: bool = False, use_local_profile: bool = False, save_local_
             if verbose:
                 print('Checking if Firefox local profile is fresh...')
             dst_folder = os.path.join(DEFAULT_USER_HOME_CACHE_PATH, 'firefox.profile')
-            last_modified = datetime.fromtimestamp(os.path.getmtime(dst_folder))
-            days_diff = (datetime.now() - last_modified).days
-            if days_diff <= copy_threshold_days:
+            age = profile_age(dst_folder)
+            if age is not None and age / 86400 <= copy_threshold_days:
                 if verbose:
                     print('Firefox local profile is fresh. Skipping the copy operation.')
-                profile_folder = dst_folder
+                profile_folder = current_profile(dst_folder)
             else:
                 if verbose:
-                    print('Copying Firefox local profile into temporary folder.')
-                if os.path.exists(dst_folder):
-                    shutil.rmtree(dst_folder)
-                shutil.copytree(src_folder, dst_folder, ignore=shutil.ignore_patterns('*parent.lock'))
-                if verbose:
-                    print('Firefox local profile copied into temporary folder.')
-                profile_folder = dst_folder
+                    print('Syncing Firefox local profile into temporary folder.')
+                profile_folder = sync_profile(src_folder, dst_folder, verbose=verbose)
         else:
             profile_folder = src_folder
     options = Options()
@@ -148,6 +517,707 @@ def firefox(headless: bool = False, use_local_profile: bool = False, save_local_
         options.set_preference('browser.download.manager.showWhenStarting', False)
         options.set_preference('browser.download.dir', download_dir)
         options.set_preference('browser.helperApps.neverAsk.saveToDisk', 'text/csv')
+    if performance:
+        options.page_load_strategy = 'eager'
+        for name, value in FIREFOX_PERFORMANCE_PREFERENCES.items():
+            options.set_preference(name, value)
+    if blocked_urls:
+        options.set_preference('network.proxy.type', 2)
+        options.set_preference('network.proxy.autoconfig_url', _blocking_pac_url(blocked_urls))
+        options.set_preference('network.proxy.autoconfig_url.include_path', True)
+        options.set_preference('network.proxy.failover_direct', False)
+        options.set_preference('network.proxy.allow_hijacking_localhost', True)
     service = Service(geckodriver_path())
     driver = webdriver.Firefox(service=service, options=options)
     return driver
+
+
+def _blocking_pac_url(blocked_urls: list[str]) -> str:
+    """
+    Returns a proxy auto-config data URL sending the requests matching any of the patterns to a closed port,
+    which Firefox uses as its URL blocklist.
+    """
+    conditions = ' || '.join(f'shExpMatch(url, {json.dumps(pattern)})' for pattern in blocked_urls)
+    pac = f'function FindProxyForURL(url, host) {{ return ({conditions}) ? "PROXY 127.0.0.1:9" : "DIRECT"; }}'
+    return 'data:application/x-ns-proxy-autoconfig,' + urllib.parse.quote(pac)
+
+
+def chrome(headless: bool = False, profile_folder: str = None, download_dir: str = None, performance: bool = False,
+           blocked_urls: list[str] = None) -> webdriver.Chrome:
+    """
+    Creates a Chrome WebDriver instance with custom options.
+
+    Args:
+        headless (bool): Whether to run Chrome in headless mode. Defaults to False.
+        profile_folder (str): Path to the Chrome user data folder. Defaults to None.
+        download_dir (str): Directory path for downloads. Defaults to None.
+        performance (bool): Whether to browse in low-overhead mode: eager page load strategy, no images, fonts or
+            media, no extensions, background networking or metrics upload. Defaults to False.
+        blocked_urls (list[str]): URL patterns ('*' wildcards) never requested. Defaults to None.
+
+    Returns:
+        webdriver.Chrome: The created Chrome WebDriver instance.
+    """
+    options = ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    if profile_folder:
+        options.add_argument(f'--user-data-dir={profile_folder}')
+    prefs = {}
+    if download_dir:
+        prefs.update({
+            'download.default_directory': download_dir,
+            'download.prompt_for_download': False,
+            'safebrowsing.enabled': False,
+        })
+    blocked_urls = list(blocked_urls or [])
+    if performance:
+        options.page_load_strategy = 'eager'
+        for argument in CHROME_PERFORMANCE_ARGUMENTS:
+            options.add_argument(argument)
+        prefs['profile.managed_default_content_settings.images'] = 2
+        blocked_urls += PERFORMANCE_BLOCKED_URLS
+    if prefs:
+        options.add_experimental_option('prefs', prefs)
+    service = ChromeService(chromedriver_path())
+    driver = webdriver.Chrome(service=service, options=options)
+    if blocked_urls:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+    return driver
+
+
+# Errors raised when the browser or its driver service died: the service going away surfaces as a connection
+# error from urllib3 rather than a WebDriverException
+DRIVER_ERRORS = (WebDriverException, ConnectionError, urllib3.exceptions.HTTPError)
+
+
+class DriverPool:
+    """
+    Bounded pool of warm WebDriver instances created by the same factory with the same options.
+
+    Drivers are handed out through driver(), reset (extra tabs closed, cookies and storage cleared) when given
+    back, and recycled after max_uses tasks or when they crashed, so the browser startup cost is paid once per
+    worker rather than once per task.
+    """
+
+    def __init__(self, factory: Callable[..., WebdriverType] = None, size: int = 4, max_uses: int = 100,
+                 warm: int = 0, **factory_kwargs):
+        """
+        Args:
+            factory (Callable[..., WebdriverType]): Function creating a driver. Defaults to firefox.
+            size (int): Maximum number of drivers alive at once. Defaults to 4.
+            max_uses (int): Number of uses after which a driver is quit and replaced. Defaults to 100.
+            warm (int): Number of drivers started right away. Defaults to 0.
+            **factory_kwargs: Keyword arguments passed to the factory, e.g. headless=True.
+        """
+        self.factory = factory or firefox
+        self.factory_kwargs = factory_kwargs
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = []
+        self._uses = {}
+        self._alive = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        for _ in range(min(warm, size)):
+            self._alive += 1
+            self._idle.append(self._create())
+
+    def __repr__(self) -> str:
+        return f'<DriverPool(size={self.size}, alive={self._alive}, idle={len(self._idle)})>'
+
+    def __enter__(self) -> 'DriverPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _create(self) -> WebdriverType:
+        try:
+            driver = self.factory(**self.factory_kwargs)
+        except BaseException:
+            with self._cond:
+                self._alive -= 1
+                self._cond.notify()
+            raise
+        self._uses[id(driver)] = 0
+        return driver
+
+    def _discard(self, driver: WebdriverType) -> None:
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._alive -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def is_alive(driver: WebdriverType) -> bool:
+        """
+        Returns whether the browser of the driver still responds, False on any error.
+        """
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def reset(driver: WebdriverType) -> None:
+        """
+        Closes every tab but the first one, clears cookies and web storage and navigates to a blank page.
+        """
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.delete_all_cookies()
+        try:
+            driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        except WebDriverException:
+            pass  # storage is not accessible on some pages, e.g. about: pages
+        driver.get('about:blank')
+
+    def acquire(self, timeout: float = None) -> WebdriverType:
+        """
+        Takes an idle driver, or creates one when fewer than size are alive, waiting for one to be released
+        otherwise.
+
+        Args:
+            timeout (float): Maximum seconds to wait for a driver. Defaults to None, waiting forever.
+
+        Returns:
+            WebdriverType: The driver, to be given back with release().
+
+        Raises:
+            TimeoutError: If no driver became available within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._alive >= self.size:
+                    if self._closed:
+                        raise RuntimeError('DriverPool is closed')
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f'No driver available within {timeout}s')
+                    self._cond.wait(remaining)
+                if self._closed:
+                    raise RuntimeError('DriverPool is closed')
+                if self._idle:
+                    driver = self._idle.pop()
+                else:
+                    self._alive += 1
+                    driver = None
+            if driver is None:
+                return self._create()
+            if self.is_alive(driver):
+                return driver
+            self._discard(driver)
+
+    def release(self, driver: WebdriverType, discard: bool = False) -> None:
+        """
+        Gives a driver back to the pool, resetting it, or quits it when discard is set, when it was used
+        max_uses times or when resetting it fails with any error. Never raises.
+
+        Args:
+            driver (WebdriverType): The driver taken with acquire().
+            discard (bool): Whether to quit the driver instead of reusing it. Defaults to False.
+        """
+        uses = self._uses.get(id(driver), 0) + 1
+        self._uses[id(driver)] = uses
+        if not discard and uses < self.max_uses and not self._closed:
+            try:
+                self.reset(driver)
+            except Exception:
+                discard = True
+            else:
+                with self._cond:
+                    if not self._closed:
+                        self._idle.append(driver)
+                        self._cond.notify()
+                        return
+        self._discard(driver)
+
+    @contextmanager
+    def driver(self, timeout: float = None) -> Iterator[WebdriverType]:
+        """
+        Context manager handing out a driver of the pool. It is recycled when the block raises one of
+        DRIVER_ERRORS, otherwise reset and given back, and recycled if that reset fails. The block's exception
+        is always the one propagated.
+
+        Args:
+            timeout (float): Maximum seconds to wait for a driver. Defaults to None, waiting forever.
+
+        Yields:
+            WebdriverType: The driver.
+        """
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        except DRIVER_ERRORS:
+            self.release(driver, discard=True)
+            raise
+        except BaseException:
+            self.release(driver)
+            raise
+        self.release(driver)
+
+    def close(self) -> None:
+        """
+        Quits the idle drivers; drivers in use are quit when released.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+
+# Suffixes of downloads still in progress
+PARTIAL_DOWNLOAD_SUFFIXES = ('.part', '.crdownload', '.tmp')
+
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_TO = 0x80
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def _inotify_libc() -> ctypes.CDLL | None:
+    """
+    Returns the C library when it provides inotify, None otherwise (e.g. on Windows).
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class DownloadWatcher:
+    """
+    Watches a download folder for completed downloads.
+
+    A download is complete once its final name exists without a partial companion ('file.csv.part' for Firefox,
+    '.crdownload' for Chrome), which is signalled by the partial file being renamed. Uses inotify where available
+    and polls the folder otherwise, in which case a file also has to keep the same size over one poll interval.
+    """
+
+    def __init__(self, directory: str, pattern: str = '*', poll_interval: float = .1, use_inotify: bool = True):
+        """
+        Args:
+            directory (str): The download folder.
+            pattern (str): Glob pattern the downloaded file names must match. Defaults to '*'.
+            poll_interval (float): Seconds between scans when polling. Defaults to 0.1.
+            use_inotify (bool): Whether to use inotify when available. Defaults to True.
+        """
+        self.directory = directory
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.completed = []
+        self._returned = 0
+        self._existing = set()
+        self._sizes = {}
+        self._fd = None
+
+    def __repr__(self) -> str:
+        return f'<DownloadWatcher(directory={self.directory}, completed={len(self.completed)})>'
+
+    def __enter__(self) -> 'DownloadWatcher':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """
+        Starts watching; files already in the folder are not reported.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        libc = self.use_inotify and _inotify_libc()
+        if libc:
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(self.directory),
+                                                  _IN_CLOSE_WRITE | _IN_MOVED_TO) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        self._existing = set(os.listdir(self.directory))  # after the watch is added so nothing is missed
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def is_inotify(self) -> bool:
+        return self._fd is not None
+
+    def pending(self) -> list[str]:
+        """
+        Returns the paths of the downloads in progress.
+        """
+        return [os.path.join(self.directory, f) for f in sorted(os.listdir(self.directory))
+                if f.endswith(PARTIAL_DOWNLOAD_SUFFIXES)]
+
+    def _is_candidate(self, name: str) -> bool:
+        path = os.path.join(self.directory, name)
+        return not name.endswith(PARTIAL_DOWNLOAD_SUFFIXES) and fnmatch.fnmatch(name, self.pattern) \
+            and not any(os.path.exists(path + suffix) for suffix in PARTIAL_DOWNLOAD_SUFFIXES) \
+            and os.path.isfile(path)
+
+    def _complete(self, name: str) -> None:
+        path = os.path.join(self.directory, name)
+        if path not in self.completed:
+            self.completed.append(path)
+
+    def _read_events(self, timeout: float) -> None:
+        if not select.select([self._fd], [], [], max(timeout, 0))[0]:
+            return
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if not self._is_candidate(name):
+                continue
+            # Firefox closes an empty placeholder under the final name before the download starts
+            if mask & _IN_MOVED_TO or os.path.getsize(os.path.join(self.directory, name)) > 0:
+                self._complete(name)
+
+    def _poll(self, timeout: float) -> None:
+        time.sleep(max(min(timeout, self.poll_interval), 0))
+        sizes = {}
+        for name in set(os.listdir(self.directory)) - self._existing:
+            if self._is_candidate(name):
+                try:
+                    sizes[name] = os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                if self._sizes.get(name) == sizes[name]:
+                    self._complete(name)
+        self._sizes = sizes
+
+    def wait(self, count: int = 1, timeout: float = None) -> list[str]:
+        """
+        Waits until count more downloads completed and returns them, returning as soon as they are complete.
+
+        Args:
+            count (int): Number of downloads to wait for. Defaults to 1.
+            timeout (float): Maximum seconds to wait. Defaults to None, waiting forever.
+
+        Returns:
+            list[str]: The paths of the completed downloads.
+
+        Raises:
+            TimeoutError: If fewer downloads completed within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self.completed) - self._returned < count:
+            remaining = self.poll_interval if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'{len(self.completed) - self._returned} of {count} downloads completed in '
+                                   f'{self.directory} within {timeout}s')
+            if self._fd is not None:
+                self._read_events(remaining)
+            else:
+                self._poll(remaining)
+        ret = self.completed[self._returned:self._returned + count]
+        self._returned += count
+        return ret
+
+    def wait_idle(self, timeout: float = None) -> list[str]:
+        """
+        Waits until no download is in progress.
+
+        Args:
+            timeout (float): Maximum seconds to wait. Defaults to None, waiting forever.
+
+        Returns:
+            list[str]: The paths of every download completed since watching started.
+
+        Raises:
+            TimeoutError: If downloads were still in progress after timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def unsettled():
+            # polling only reports a file once its size held over a scan
+            new = set(os.listdir(self.directory)) - self._existing
+            return self._fd is None and any(self._is_candidate(f) and os.path.join(self.directory, f) not in
+                                            self.completed for f in new)
+
+        while self.pending() or unsettled():
+            remaining = self.poll_interval if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'Downloads still in progress in {self.directory} after {timeout}s')
+            if self._fd is not None:
+                self._read_events(min(remaining, self.poll_interval))
+            else:
+                self._poll(remaining)
+        if self._fd is not None:
+            self._read_events(0)
+        return list(self.completed)
+
+
+def wait_for_download(directory: str, action: Callable[[], Any], count: int = 1, timeout: float = 60.,
+                      pattern: str = '*') -> list[str]:
+    """
+    Triggers a download and waits for it to complete.
+
+    Args:
+        directory (str): The download folder of the browser.
+        action (Callable[[], Any]): Function triggering the download(s), e.g. clicking a link.
+        count (int): Number of downloads triggered. Defaults to 1.
+        timeout (float): Maximum seconds to wait. Defaults to 60.
+        pattern (str): Glob pattern the downloaded file names must match. Defaults to '*'.
+
+    Returns:
+        list[str]: The paths of the completed downloads.
+
+    Raises:
+        TimeoutError: If the downloads did not complete within timeout.
+    """
+    with DownloadWatcher(directory, pattern=pattern) as watcher:
+        action()
+        return watcher.wait(count, timeout)
+
+
+class TaskResult(NamedTuple):
+    """
+    Outcome of a task run by BrowserTaskExecutor.
+    """
+    index: int  # position of the task in the submitted tasks
+    value: Any  # return value of the task, None if it failed
+    error: BaseException | None  # last error if every attempt failed
+    attempts: int
+    elapsed: float  # seconds spent over all attempts
+    downloads: list[str]  # files downloaded by the successful attempt
+    worker: int
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BrowserTaskExecutor:
+    """
+    Runs tasks across N isolated headless browsers, one per worker thread.
+
+    Each worker owns its driver, its own copy of the profile and its own download folder. A task is a callable
+    taking the driver; tasks are retried on failure, a task running over timeout gets its browser quit by a
+    watchdog, and crashed or timed out browsers are restarted. Files a task downloads are moved into a folder
+    of their own and reported in its TaskResult.
+    """
+
+    def __init__(self, n_workers: int = 4, factory: Callable[..., WebdriverType] = None, output_dir: str = None,
+                 profile_folder: str = None, timeout: float = None, retries: int = 1, max_uses: int = 100,
+                 download_timeout: float = 30., **factory_kwargs):
+        """
+        Args:
+            n_workers (int): Number of browsers run concurrently. Defaults to 4.
+            factory (Callable[..., WebdriverType]): Function creating a driver, taking headless, download_dir and
+                profile_folder keyword arguments. Defaults to firefox.
+            output_dir (str): Folder receiving the worker folders and the downloads of each task. Defaults to a new
+                temporary folder.
+            profile_folder (str): Profile synced into a private copy for every worker. Defaults to None.
+            timeout (float): Seconds after which a task's browser is quit. Defaults to None, no timeout.
+            retries (int): Number of times a failed task is retried. Defaults to 1.
+            max_uses (int): Number of tasks after which a browser is restarted. Defaults to 100.
+            download_timeout (float): Seconds to wait after a task for the downloads it left in progress.
+                Defaults to 30.
+            **factory_kwargs: Additional keyword arguments passed to the factory.
+        """
+        self.n_workers = n_workers
+        self.factory = factory or firefox
+        self.output_dir = output_dir or tempfile.mkdtemp(prefix='browser-tasks-')
+        self.profile_folder = profile_folder
+        self.timeout = timeout
+        self.retries = retries
+        self.max_uses = max_uses
+        self.download_timeout = download_timeout
+        self.factory_kwargs = dict(factory_kwargs, headless=factory_kwargs.get('headless', True))
+
+    def __repr__(self) -> str:
+        return f'<BrowserTaskExecutor(n_workers={self.n_workers}, output_dir={self.output_dir})>'
+
+    def _worker_folder(self, worker: int, name: str) -> str:
+        path = os.path.join(self.output_dir, f'worker-{worker}', name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _create_driver(self, worker: int) -> WebdriverType:
+        kwargs = dict(self.factory_kwargs, download_dir=self._worker_folder(worker, 'downloads'))
+        if self.profile_folder:
+            kwargs['profile_folder'] = sync_profile(self.profile_folder, self._worker_folder(worker, 'profile'))
+        return self.factory(**kwargs)
+
+    @staticmethod
+    def _quit(driver: WebdriverType) -> None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _collect_downloads(self, download_dir: str, before: set[str], index: int) -> list[str]:
+        """
+        Moves the files that appeared in the worker download folder during a task into the task's own folder.
+        """
+        new = sorted(f for f in set(os.listdir(download_dir)) - before if not f.endswith(PARTIAL_DOWNLOAD_SUFFIXES))
+        if not new:
+            return []
+        task_dir = os.path.join(self.output_dir, f'task-{index}')
+        os.makedirs(task_dir, exist_ok=True)
+        ret = []
+        for file in new:
+            ret.append(os.path.join(task_dir, file))
+            shutil.move(os.path.join(download_dir, file), ret[-1])
+        return ret
+
+    def _run_task(self, worker: int, driver: WebdriverType, index: int, task: Callable[[WebdriverType], Any]):
+        """
+        Runs one attempt of a task under the watchdog, returning (value, error, downloads, driver still usable).
+        Any error checking the driver or collecting the downloads marks the driver as not usable.
+        """
+        download_dir = self._worker_folder(worker, 'downloads')
+        before = set(os.listdir(download_dir))
+        timed_out = threading.Event()
+
+        def watchdog():
+            timed_out.set()
+            self._quit(driver)
+
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, watchdog)
+            timer.daemon = True
+            timer.start()
+        with DownloadWatcher(download_dir) as watcher:
+            try:
+                value = task(driver)
+                error = None
+            except BaseException as e:
+                value, error = None, e
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            if error is None and not timed_out.is_set() and self.download_timeout:
+                try:
+                    watcher.wait_idle(self.download_timeout)
+                except TimeoutError:
+                    pass  # collected without the unfinished downloads
+        if timed_out.is_set():
+            return None, TimeoutError(f'Task {index} exceeded {self.timeout}s'), [], False
+        if error is not None:
+            return None, error, [], not isinstance(error, DRIVER_ERRORS) and DriverPool.is_alive(driver)
+        try:
+            return value, None, self._collect_downloads(download_dir, before, index), True
+        except Exception as e:
+            return None, e, [], False
+
+    def _work(self, worker: int, tasks: queue.Queue, results: queue.Queue) -> None:
+        driver, uses = None, 0
+        try:
+            while True:
+                try:
+                    index, task = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                t0 = time.time()
+                attempts, value, error, downloads = 0, None, None, []
+                try:
+                    while attempts <= self.retries:
+                        attempts += 1
+                        try:
+                            if driver is None:
+                                driver, uses = self._create_driver(worker), 0
+                        except Exception as e:
+                            error = e
+                            continue
+                        try:
+                            value, error, downloads, usable = self._run_task(worker, driver, index, task)
+                        except Exception as e:
+                            value, error, downloads, usable = None, e, [], False
+                        uses += 1
+                        if usable and uses < self.max_uses:
+                            try:
+                                DriverPool.reset(driver)
+                            except Exception:
+                                usable = False
+                        if not usable or uses >= self.max_uses:
+                            self._quit(driver)
+                            driver = None
+                        if error is None:
+                            break
+                except BaseException as e:
+                    value, error, downloads = None, e, []
+                    raise
+                finally:
+                    results.put(TaskResult(index, value, error, attempts, time.time() - t0, downloads, worker))
+        finally:
+            if driver is not None:
+                self._quit(driver)
+            results.put(None)
+
+    def imap(self, tasks: Iterable[Callable[[WebdriverType], Any]]) -> Iterator[TaskResult]:
+        """
+        Runs the tasks and yields their results as they complete.
+
+        Args:
+            tasks (Iterable[Callable[[WebdriverType], Any]]): Callables taking the driver.
+
+        Yields:
+            TaskResult: The result of each task, in completion order.
+        """
+        pending = queue.Queue()
+        n_tasks = 0
+        for n_tasks, task in enumerate(tasks, 1):
+            pending.put((n_tasks - 1, task))
+        results = queue.Queue()
+        n_workers = min(self.n_workers, n_tasks)
+        threads = [threading.Thread(target=self._work, args=(i, pending, results), name=f'BrowserTask-{i}',
+                                    daemon=True) for i in range(n_workers)]
+        for thread in threads:
+            thread.start()
+        done = 0
+        while done < n_workers:
+            result = results.get()
+            if result is None:
+                done += 1
+            else:
+                yield result
+
+    def map(self, tasks: Iterable[Callable[[WebdriverType], Any]]) -> list[TaskResult]:
+        """
+        Runs the tasks and returns their results in task order.
+
+        Args:
+            tasks (Iterable[Callable[[WebdriverType], Any]]): Callables taking the driver.
+
+        Returns:
+            list[TaskResult]: The result of each task.
+
+        Raises:
+            RuntimeError: If some tasks got no result, their workers having died.
+        """
+        tasks = list(tasks)
+        results = sorted(self.imap(tasks), key=lambda r: r.index)
+        if len(results) != len(tasks):
+            raise RuntimeError(f'Got {len(results)} results for {len(tasks)} tasks, workers died')
+        return results